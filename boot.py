@@ -4,6 +4,15 @@ import network
 import ntptime
 import machine
 import time
+from lib.ota_stage import stage as ota_stage
+
+# Install a staged OTA update, or roll back one that keeps failing, before
+# any of the files it replaces are imported.
+try:
+    print(f"OTA: {ota_stage.boot()}")
+except Exception as e:
+    print(f"OTA: staged update could not be applied: {e}")
+
 from lib.config_loader import config
 
 try:
@@ -15,6 +15,100 @@ TIMEZONE_POSIX = "EET-2EEST,M3.5.0/3,M10.5.0/4"
 # Remote Data-logging Server (set to None to disable remote posting)
 REMOTE_POST_URL = None  # 'http://172.16.1.111:8088/api/logData'
 
+# Samples per POST. 1 posts a single JSON object (original format);
+# larger values post a JSON array of up to this many samples.
+REMOTE_POST_BATCH = 1
+
+# Payload encoding: 'json' or 'packed' (compact binary frames, always a
+# batch; decode server-side with lib/telemetry_codec.py or
+# tools/decode_telemetry.py). REMOTE_POST_DEFLATE compresses packed batches.
+REMOTE_POST_FORMAT = 'json'
+REMOTE_POST_DEFLATE = False
+
+# Timeout in seconds for each step of a remote POST (connect, send, every
+# read); the POST runs on the event loop and never blocks it
+REMOTE_POST_TIMEOUT = 5
+
+# Seconds an idle keep-alive connection to the remote host is reused
+REMOTE_KEEPALIVE = 60
+
+# Post only fields that crossed their REPORT_RULES threshold, plus a full
+# keyframe every REPORT_KEYFRAME_INTERVAL seconds. Delta records carry
+# "keyframe": false, full records "keyframe": true.
+REMOTE_POST_CHANGES_ONLY = False
+
+# Samples held in RAM before spilling to the flash journal
+OUTBOX_QUEUE_SIZE = 10
+
+# Maximum samples kept in the flash journal while the host is down
+# (500 samples at 30 s intervals is a little over 4 hours); when it is
+# full the oldest samples are dropped
+OUTBOX_JOURNAL_MAX = 500
+
+# Upper bound in seconds for the retry backoff
+OUTBOX_BACKOFF_MAX = 600
+
+# --- MQTT Telemetry (set MQTT_BROKER to None to disable) ---
+MQTT_BROKER = None  # '192.168.1.10'
+MQTT_PORT = 1883
+MQTT_USER = None
+MQTT_PASSWORD = None
+MQTT_CLIENT_ID = None   # None = 'npbc-<chip id>'; must be stable for session resume
+MQTT_KEEPALIVE = 60
+# Fields publish to <prefix>/<field>, snapshots to <prefix>/state,
+# commands are accepted on <prefix>/set as {"mode": 1, "priority": 0}
+MQTT_TOPIC_PREFIX = 'npbc'
+# Seconds between full retained snapshots on <prefix>/state
+MQTT_SNAPSHOT_INTERVAL = 300
+
+# --- Outbound Reporting Policy (remote posting and MQTT) ---
+# Per-field rules: 'abs' / 'rel' deadband, 'min' seconds between reports,
+# 'max' seconds without a report (heartbeat). Fields without a rule use
+# REPORT_DEFAULT_RULE; with no deadband any change is reported.
+REPORT_RULES = {
+    'KTYPE': {'abs': 2.0, 'min': 60},
+    'TBMP': {'abs': 0.2},
+    'PBMP': {'abs': 0.5},
+    'HUM': {'abs': 1.0},
+    'TDS18': {'abs': 0.2},
+}
+REPORT_DEFAULT_RULE = {'max': 900}
+# Sent with every non-empty report, but never trigger one on their own
+REPORT_ALWAYS_FIELDS = ('Date',)
+# Seconds between full keyframes on the remote POST sink
+REPORT_KEYFRAME_INTERVAL = 600
+
+# Seconds the device fields in /api/data (uptime, RSSI, heap) are cached
+API_ESP32_TTL = 5
+
+# Data versions kept for /api/data?since=<version> delta responses
+API_CHANGELOG_SIZE = 16
+
+# Live dashboard stream (/api/stream): concurrent subscribers and
+# seconds between heartbeat comments
+SSE_MAX_CLIENTS = 4
+SSE_HEARTBEAT = 15
+
+# Concurrent /api/ws live data + control sockets (heartbeat as above)
+WS_MAX_CLIENTS = 4
+
+# Web server keep-alive: seconds an idle connection is held open and
+# requests served per connection (1 disables keep-alive)
+HTTP_KEEPALIVE_TIMEOUT = 5
+HTTP_MAX_REQUESTS = 100
+
+# Web server admission control. Connections over HTTP_MAX_CONNECTIONS
+# (live /api/stream and /api/ws clients included) and requests arriving
+# with less than HTTP_MIN_FREE_MEMORY bytes of free heap get a quick 503;
+# clients above HTTP_RATE_LIMIT requests/s (bursts of HTTP_RATE_BURST)
+# get a 429. Slow clients must send their request within
+# HTTP_REQUEST_TIMEOUT seconds. None disables a limit.
+HTTP_MAX_CONNECTIONS = 12
+HTTP_RATE_LIMIT = 10
+HTTP_RATE_BURST = 30
+HTTP_MIN_FREE_MEMORY = 24 * 1024
+HTTP_REQUEST_TIMEOUT = 10
+
 # ESP32 Static IP (None for DHCP)
 # To use: STATIC_IP = ('192.168.1.100', '255.255.255.0', '192.168.1.1', '8.8.8.8')
 STATIC_IP = None
@@ -25,6 +119,10 @@ ENABLE_FTP = True
 
 # --- OTA Update Configuration ---
 GITHUB_REPO = 'https://github.com/atanas-vladimirov/npbc-esp32-monitor'
+OTA_SOURCE = 'github'   # 'github', or 'mirror' for a LAN mirror (tools/ota_mirror.py)
+OTA_MIRROR_URL = None   # e.g. 'http://192.168.1.10:8080' when OTA_SOURCE = 'mirror'
+OTA_CHECK_INTERVAL = 6 * 3600  # Seconds between background checks for a new release (0 = only on request)
+OTA_HEALTH_DELAY = 120  # Seconds an applied update must run before it is kept (rolled back after 3 failed boots)
 
 # --- Pin Assignments ---
 # MAX6675 K-Type thermocouple (SPI bus 1)
@@ -0,0 +1,314 @@
+# lib/http_client.py - Keep-alive async HTTP/1.1 client on uasyncio streams
+import usocket as socket
+import ujson
+import time
+import uasyncio as asyncio
+
+
+def _split_url(url):
+    """Splits a URL into (scheme, host, port, path)."""
+    scheme, _, rest = url.partition('://')
+    if not rest:
+        raise ValueError(f"Invalid URL: {url}")
+    host, slash, path = rest.partition('/')
+    path = slash + path if slash else '/'
+    if ':' in host:
+        host, port = host.rsplit(':', 1)
+        port = int(port)
+    else:
+        port = 443 if scheme == 'https' else 80
+    return scheme, host, port, path
+
+
+class HTTPResponse:
+    """
+    A response whose body is read incrementally from the connection.
+    The body must be consumed (or the response closed) before the
+    connection can be reused for the next request.
+    """
+
+    def __init__(self, client, key, conn, status_code, reason, headers):
+        self._client = client
+        self._key = key
+        self._conn = conn
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self._chunked = 'chunked' in headers.get('transfer-encoding', '')
+        length = headers.get('content-length')
+        self._remaining = int(length) if length is not None else -1
+        self._chunk_left = 0
+        self._keep_alive = headers.get('connection', '').lower() != 'close' \
+            and (self._chunked or self._remaining >= 0)
+        self._done = self._remaining == 0
+
+    async def _read_chunked(self, n):
+        reader = self._conn[0]
+        if self._chunk_left == 0:
+            line = await reader.readline()
+            self._chunk_left = int(line.split(b';')[0].strip(), 16)
+            if self._chunk_left == 0:
+                # skip any trailers up to the terminating blank line
+                while (await reader.readline()).strip():
+                    pass
+                return b''
+        data = await reader.read(min(n, self._chunk_left))
+        if not data:
+            raise OSError("Connection lost")
+        self._chunk_left -= len(data)
+        if self._chunk_left == 0:
+            await reader.readline()  # CRLF after the chunk
+        return data
+
+    async def _read_body(self, n):
+        if self._chunked:
+            return await self._read_chunked(n)
+        if self._remaining >= 0:
+            data = await self._conn[0].read(min(n, self._remaining))
+            if not data:
+                raise OSError("Connection lost")
+            self._remaining -= len(data)
+            return data
+        return await self._conn[0].read(n)
+
+    async def read(self, n=1024):
+        """Returns up to n bytes of body, or b'' once the body is complete.
+        Raises asyncio.TimeoutError (and drops the connection) if the server
+        sends nothing for the client's timeout."""
+        if self._done:
+            return b''
+        try:
+            data = await asyncio.wait_for(self._read_body(n), self._client.timeout)
+        except Exception:
+            self._done = True
+            self._keep_alive = False
+            await self.aclose()
+            raise
+        if not data or self._remaining == 0:
+            self._done = True
+            await self.aclose()
+        return data
+
+    async def content(self):
+        """Reads the whole body into memory. Use read() for large bodies."""
+        parts = []
+        while True:
+            data = await self.read()
+            if not data:
+                break
+            parts.append(data)
+        return b''.join(parts)
+
+    async def text(self):
+        return (await self.content()).decode()
+
+    async def json(self):
+        return ujson.loads(await self.content())
+
+    async def aclose(self):
+        """Returns the connection to the pool, or closes it if the body was
+        not fully read or the server asked to close."""
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        if self._done and self._keep_alive:
+            self._client._release(self._key, conn)
+        else:
+            await self._client._close_conn(conn)
+
+
+class HTTPClient:
+    """
+    A small non-blocking HTTP/1.1 client that keeps one persistent
+    connection per origin and caches DNS results, so periodic requests to
+    the same host skip the lookup and the TCP/TLS handshake.
+    """
+
+    def __init__(self, timeout=10, idle_timeout=30, dns_ttl=300, headers=None):
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.dns_ttl = dns_ttl
+        self.headers = headers or {}
+        self._dns = {}
+        self._pool = {}
+        self.connects = 0
+        self.reuses = 0
+        self.dns_lookups = 0
+
+    def _resolve(self, host, port):
+        """Returns the IP address for host, from cache while the TTL holds."""
+        now = time.time()
+        cached = self._dns.get(host)
+        if cached and cached[1] > now:
+            return cached[0]
+        # getaddrinfo blocks, but only on a cache miss
+        ip = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0][-1][0]
+        self.dns_lookups += 1
+        self._dns[host] = (ip, now + self.dns_ttl)
+        return ip
+
+    async def _open(self, scheme, host, port):
+        ip = self._resolve(host, port)
+        if scheme == 'https':
+            coro = asyncio.open_connection(ip, port, ssl=True, server_hostname=host)
+        else:
+            coro = asyncio.open_connection(ip, port)
+        try:
+            conn = await asyncio.wait_for(coro, self.timeout)
+        except Exception:
+            # the cached address may be stale
+            self._dns.pop(host, None)
+            raise
+        self.connects += 1
+        return conn
+
+    def _release(self, key, conn):
+        old = self._pool.get(key)
+        self._pool[key] = (conn, time.time())
+        if old and old[0] is not conn:
+            asyncio.create_task(self._close_conn(old[0]))
+
+    async def _close_conn(self, conn):
+        try:
+            conn[1].close()
+            await conn[1].wait_closed()
+        except Exception:
+            pass
+
+    async def _acquire(self, key):
+        """Returns (conn, reused) for an origin, dropping idle connections."""
+        pooled = self._pool.pop(key, None)
+        if pooled:
+            conn, last_used = pooled
+            if time.time() - last_used < self.idle_timeout:
+                self.reuses += 1
+                return conn, True
+            await self._close_conn(conn)
+        return await self._open(*key), False
+
+    async def close(self):
+        """Closes all pooled connections."""
+        pool, self._pool = self._pool, {}
+        for conn, _ in pool.values():
+            await self._close_conn(conn)
+
+    async def _send(self, writer, method, host, path, headers, body):
+        lines = [f'{method} {path} HTTP/1.1\r\nHost: {host}\r\n']
+        for name, value in headers.items():
+            lines.append(f'{name}: {value}\r\n')
+        lines.append('\r\n')
+        head = ''.join(lines).encode()
+        if body is None or isinstance(body, (bytes, bytearray)):
+            writer.write(head + body if body else head)
+            await writer.drain()
+            return
+        # chunked upload from a sync or async iterable
+        writer.write(head)
+        if hasattr(body, '__anext__'):
+            async for chunk in body:
+                await self._send_chunk(writer, chunk)
+        else:
+            for chunk in body:
+                await self._send_chunk(writer, chunk)
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    async def _send_chunk(self, writer, chunk):
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        if chunk:
+            writer.write(('%x\r\n' % len(chunk)).encode())
+            writer.write(chunk)
+            writer.write(b'\r\n')
+            await writer.drain()
+
+    async def _read_head(self, reader):
+        line = await reader.readline()
+        if not line:
+            raise OSError("Connection closed by server")
+        parts = line.decode().strip().split(' ', 2)
+        status_code = int(parts[1])
+        reason = parts[2] if len(parts) > 2 else ''
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if not line or line == b'\r\n':
+                break
+            name, _, value = line.decode().partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return status_code, reason, headers
+
+    async def request(self, method, url, body=None, json=None, headers=None, redirects=0):
+        """
+        Sends a request and returns an HTTPResponse once the status line and
+        headers have arrived. `body` may be bytes, a str, or a (sync or
+        async) iterable of chunks, which is sent with chunked encoding.
+        Up to `redirects` redirects are followed; a 303 turns the request
+        into a GET.
+        """
+        scheme, host, port, path = _split_url(url)
+        key = (scheme, host, port)
+        # the port belongs in Host unless it is the scheme's default
+        authority = host if port == (443 if scheme == 'https' else 80) else f'{host}:{port}'
+        hdrs = dict(self.headers)
+        if headers:
+            hdrs.update(headers)
+        if json is not None:
+            body = ujson.dumps(json)
+            hdrs.setdefault('Content-Type', 'application/json')
+        if isinstance(body, str):
+            body = body.encode()
+        if body is None or isinstance(body, (bytes, bytearray)):
+            if body is not None or method in ('POST', 'PUT', 'PATCH'):
+                hdrs['Content-Length'] = len(body) if body else 0
+        else:
+            hdrs['Transfer-Encoding'] = 'chunked'
+
+        for attempt in range(2):
+            conn, reused = await self._acquire(key)
+            try:
+                await asyncio.wait_for(
+                    self._send(conn[1], method, authority, path, hdrs, body), self.timeout)
+                status_code, reason, resp_headers = await asyncio.wait_for(
+                    self._read_head(conn[0]), self.timeout)
+                break
+            except Exception:
+                await self._close_conn(conn)
+                # A pooled connection may have been closed by the server
+                # while idle; retry once on a fresh one. Streaming bodies
+                # cannot be replayed.
+                if not reused or attempt or not (body is None or isinstance(body, (bytes, bytearray))):
+                    raise
+        response = HTTPResponse(self, key, conn, status_code, reason, resp_headers)
+        if method == 'HEAD' or status_code in (204, 304) or response._done:
+            response._done = True
+            await response.aclose()
+        location = resp_headers.get('location')
+        if redirects > 0 and location and status_code in (301, 302, 303, 307, 308):
+            # drain a short body so the connection can be reused
+            if 0 <= response._remaining <= 1024:
+                await response.content()
+            await response.aclose()
+            if location.startswith('/'):
+                location = f'{scheme}://{host}:{port}{location}'
+            elif '://' not in location:
+                location = url.rsplit('/', 1)[0] + '/' + location
+            if status_code == 303 or (status_code in (301, 302) and method == 'POST'):
+                method, body, json = 'GET', None, None
+            return await self.request(method, location, body=body, json=json,
+                                      headers=headers, redirects=redirects - 1)
+        return response
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    def stats(self):
+        return {
+            'connects': self.connects,
+            'reuses': self.reuses,
+            'dns_lookups': self.dns_lookups,
+            'pooled': len(self._pool),
+        }
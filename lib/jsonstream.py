@@ -0,0 +1,75 @@
+# lib/jsonstream.py - Incremental JSON encoder for streamed response bodies
+import ujson
+
+
+class JSONStream:
+    """
+    Async iterator body that serializes `obj` as JSON in chunks of at most
+    `chunk_size` bytes, filled into one preallocated buffer. Peak memory
+    per response is the buffer plus the largest single scalar, however
+    long the lists are, and no large contiguous string is ever needed.
+
+    Each chunk is a memoryview of that buffer, so nothing is copied until
+    the response writer sends it; it is only valid until the next chunk is
+    requested, which Microdot's write loop never does before it is done
+    with the previous one.
+
+    Output matches ujson.dumps(obj). Containers are walked lazily, so
+    they must not be mutated in place while the response is being sent;
+    replacing or appending items is safe.
+
+        return Response(JSONStream(items),
+                        headers={'Content-Type': 'application/json'})
+    """
+
+    def __init__(self, obj, chunk_size=512):
+        self._tokens = self._walk(obj)
+        self._buf = bytearray(chunk_size)
+        self._view = memoryview(self._buf)
+        self._pending = b''
+
+    def _walk(self, obj):
+        if isinstance(obj, dict):
+            yield '{'
+            sep = ''
+            for key, value in obj.items():
+                yield sep + ujson.dumps(str(key)) + ': '
+                yield from self._walk(value)
+                sep = ', '
+            yield '}'
+        elif isinstance(obj, (list, tuple)):
+            yield '['
+            sep = ''
+            for value in obj:
+                if sep:
+                    yield sep
+                yield from self._walk(value)
+                sep = ', '
+            yield ']'
+        else:
+            yield ujson.dumps(obj)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        view = self._view
+        n = 0
+        while n < len(view):
+            piece = self._pending
+            if not piece:
+                try:
+                    piece = next(self._tokens).encode()
+                except StopIteration:
+                    break
+            take = min(len(piece), len(view) - n)
+            view[n:n + take] = piece[:take]
+            n += take
+            self._pending = piece[take:]
+        if not n:
+            raise StopAsyncIteration
+        return view[:n]
+
+    async def aclose(self):
+        self._tokens = iter(())
+        self._pending = b''
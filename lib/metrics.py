@@ -0,0 +1,122 @@
+# lib/metrics.py - Prometheus text and Influx line-protocol rendering
+#
+# Both renderers are generators that Microdot streams straight to the
+# socket without building the whole document in RAM. Lines are gathered
+# into chunks of about CHUNK_SIZE bytes, so a scrape goes out in a few
+# socket writes rather than one per metric.
+
+# Stats keys that only ever grow; everything else is a gauge.
+_COUNTERS = ('sent', 'dropped', 'errors', 'published', 'received',
+             'reconnects', 'connects', 'reuses', 'dns_lookups', 'suppressed')
+
+CHUNK_SIZE = 512
+
+
+def _chunked(lines, size=CHUNK_SIZE):
+    """Joins the strings from `lines` into chunks of at least `size`
+    characters (the last one may be shorter)."""
+    buf = []
+    length = 0
+    for line in lines:
+        buf.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(buf)
+            buf = []
+            length = 0
+    if buf:
+        yield ''.join(buf)
+
+
+def _number(value):
+    """Returns a numeric value for exposition, or None for non-numeric data."""
+    if isinstance(value, bool):
+        return 1 if value else 0
+    if isinstance(value, (int, float)):
+        return value
+    return None
+
+
+def prometheus(prefix, groups, stats):
+    """
+    Yields Prometheus text exposition, in chunks of whole lines.
+
+    groups: list of (name, dict) pairs of gauges, e.g. ('burner', {...}).
+            Non-numeric values are skipped.
+    stats:  dict of component name -> stats dict (e.g. outbox.stats()).
+            Keys listed in _COUNTERS are exposed as counters.
+    """
+    return _chunked(_prometheus_lines(prefix, groups, stats))
+
+
+def _prometheus_lines(prefix, groups, stats):
+    for group, data in groups:
+        if not data:
+            continue
+        for key, value in data.items():
+            value = _number(value)
+            if value is None:
+                continue
+            name = f'{prefix}_{group}_{key.lower()}'
+            yield f'# TYPE {name} gauge\n{name} {value}\n'
+    for component, data in stats.items():
+        if not data:
+            continue
+        for key, value in data.items():
+            value = _number(value)
+            if value is None:
+                continue
+            if key in _COUNTERS:
+                name = f'{prefix}_{component}_{key}_total'
+                yield f'# TYPE {name} counter\n{name} {value}\n'
+            else:
+                name = f'{prefix}_{component}_{key}'
+                yield f'# TYPE {name} gauge\n{name} {value}\n'
+
+
+def _influx_value(value, as_float=False):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, int):
+        return repr(float(value)) if as_float else f'{value}i'
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, str):
+        return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    return None
+
+
+def _influx_escape(s):
+    return s.replace(',', '\\,').replace(' ', '\\ ').replace('=', '\\=')
+
+
+def influx(measurement, groups, stats, tags=None, float_groups=()):
+    """
+    Yields Influx line protocol in chunks of whole lines, one line per
+    group and per stats component, tagged with `group=<name>`. No timestamp is written;
+    the server assigns the receive time.
+
+    Integers in `float_groups` are written as floats: InfluxDB rejects a
+    line whose field changes type, e.g. a sensor reading 21.5 that falls
+    back to 0 when the sensor fails.
+    """
+    return _chunked(_influx_lines(measurement, groups, stats, tags, float_groups))
+
+
+def _influx_lines(measurement, groups, stats, tags, float_groups):
+    tag_str = ''
+    if tags:
+        for key, value in tags.items():
+            if value is not None:
+                tag_str += f',{_influx_escape(key)}={_influx_escape(str(value))}'
+    for group, data in list(groups) + list(stats.items()):
+        if not data:
+            continue
+        fields = []
+        as_float = group in float_groups
+        for key, value in data.items():
+            value = _influx_value(value, as_float)
+            if value is not None:
+                fields.append(f'{_influx_escape(key)}={value}')
+        if fields:
+            yield f'{measurement}{tag_str},group={group} {",".join(fields)}\n'
@@ -6,7 +6,9 @@ The ``microdot`` module defines a few classes that help implement HTTP-based
 servers for MicroPython and standard Python.
 """
 import asyncio
+import gc
 import io
+import os
 import re
 import time
 
@@ -53,6 +55,15 @@ except ImportError:  # pragma: no cover
     def print_exception(exc):
         traceback.print_exc()
 
+try:
+    from time import ticks_ms, ticks_diff  # type: ignore[attr-defined]
+except ImportError:  # pragma: no cover
+    def ticks_ms():
+        return int(time.monotonic() * 1000)
+
+    def ticks_diff(a, b):
+        return a - b
+
 MUTED_SOCKET_ERRORS = [
     32,  # Broken pipe
     54,  # Connection reset by peer
@@ -361,12 +372,21 @@ class Request:
         self.g = Request.G()
 
         self.http_version = http_version
+        connection = self.headers.get('Connection', '').lower()
+        #: Whether the client allows the connection to be reused for another
+        #: request, based on the HTTP version and the ``Connection`` header.
+        self.keep_alive = 'keep-alive' in connection \
+            if http_version == '1.0' else 'close' not in connection
         if '?' in self.path:
             self.path, self.query_string = self.path.split('?', 1)
             self.args = self._parse_urlencoded(self.query_string)
 
         if 'Content-Length' in self.headers:
             self.content_length = int(self.headers['Content-Length'])
+        if self.content_length > Request.max_body_length:
+            # the body is left in the stream, where the end of this request
+            # cannot be found reliably once the handler returns
+            self.keep_alive = False
         if 'Content-Type' in self.headers:
             self.content_type = self.headers['Content-Type']
         if 'Cookie' in self.headers:
@@ -422,16 +442,51 @@ class Request:
 
         # body
         body = b''
-        if content_length and content_length <= Request.max_body_length:
+        transfer_encoding = headers.get('Transfer-Encoding', '').lower()
+        if transfer_encoding == 'chunked':
+            body = await Request._read_chunked(client_reader)
+            stream = None
+        elif content_length and content_length <= Request.max_body_length:
             body = await client_reader.readexactly(content_length)
             stream = None
         else:
             body = b''
             stream = client_reader
 
-        return Request(app, client_addr, method, url, http_version, headers,
-                       body=body, stream=stream,
-                       sock=(client_reader, client_writer), scheme=scheme)
+        req = Request(app, client_addr, method, url, http_version, headers,
+                      body=body or b'', stream=stream,
+                      sock=(client_reader, client_writer), scheme=scheme)
+        if transfer_encoding == 'chunked':
+            if body is None:
+                # too large to buffer; rejected with a 413 and the rest of
+                # the body is never read
+                req.content_length = Request.max_content_length + 1
+                req.keep_alive = False
+            else:
+                req.content_length = len(body)
+        elif transfer_encoding:
+            # unsupported encoding: the end of the body cannot be found
+            req.keep_alive = False
+        return req
+
+    @staticmethod
+    async def _read_chunked(stream):
+        """Read a chunked request body. Returns ``None`` without reading
+        further if it is larger than ``max_body_length``."""
+        body = b''
+        while True:
+            line = (await Request._safe_readline(stream)).strip().decode()
+            size = int(line.split(';', 1)[0], 16)
+            if not size:
+                break
+            if len(body) + size > Request.max_body_length:
+                return None
+            body += await stream.readexactly(size)
+            await stream.readexactly(2)  # CRLF after the chunk data
+        # skip the trailer section
+        while (await Request._safe_readline(stream)).strip():
+            pass
+        return body
 
     def _parse_urlencoded(self, urlencoded):
         data = MultiDict()
@@ -566,6 +621,12 @@ class Response:
 
     send_file_buffer_size = 1024
 
+    #: Bodies, or first body chunks, up to this size are sent in the same
+    #: write as the status line and headers, so that small responses leave
+    #: in a single TCP segment. Larger ones are written separately to avoid
+    #: copying them.
+    max_coalesce_length = 1024
+
     #: The content type to use for responses that do not explicitly define a
     #: ``Content-Type`` header.
     default_content_type = 'text/plain'
@@ -594,6 +655,14 @@ class Response:
             # this applies to bytes, file-like objects or generators
             self.body = body
         self.is_head = False
+        #: Whether the connection stays open after this response. Set by the
+        #: server before writing; cleared if the body length is unknown and
+        #: chunked encoding cannot be used.
+        self.keep_alive = False
+        #: Whether a body of unknown length is sent with chunked transfer
+        #: encoding. Set by the server for HTTP/1.1 clients; cleared when
+        #: the response has a ``Content-Length``.
+        self.chunked = False
 
     def set_cookie(self, cookie, value, path=None, domain=None, expires=None,
                    max_age=None, secure=False, http_only=False,
@@ -657,41 +726,74 @@ class Response:
             self.headers['Content-Type'] = self.default_content_type
             if 'charset=' not in self.headers['Content-Type']:
                 self.headers['Content-Type'] += '; charset=UTF-8'
+        if 'Content-Length' in self.headers:
+            self.chunked = False
+        elif self.keep_alive and self.chunked:
+            self.headers['Transfer-Encoding'] = 'chunked'
+        else:
+            # without a length or chunks the client can only find the end of
+            # the body when the connection is closed
+            self.keep_alive = False
+            self.chunked = False
+        self.headers['Connection'] = 'keep-alive' if self.keep_alive \
+            else 'close'
 
     async def write(self, stream):
         self.complete()
 
         try:
-            # status code
+            # status line and headers, rendered into a single buffer
             reason = self.reason if self.reason is not None else \
                 ('OK' if self.status_code == 200 else 'N/A')
-            await stream.awrite('HTTP/1.0 {status_code} {reason}\r\n'.format(
+            buf = bytearray('HTTP/1.1 {status_code} {reason}\r\n'.format(
                 status_code=self.status_code, reason=reason).encode())
-
-            # headers
             for header, value in self.headers.items():
                 values = value if isinstance(value, list) else [value]
                 for value in values:
-                    await stream.awrite('{header}: {value}\r\n'.format(
-                        header=header, value=value).encode())
-            await stream.awrite(b'\r\n')
+                    buf += '{header}: {value}\r\n'.format(
+                        header=header, value=value).encode()
+            buf += b'\r\n'
+            if hasattr(self.body, '__anext__'):
+                # an async body may take a while to produce its first chunk,
+                # so the headers are not held back waiting for it
+                await stream.awrite(buf)
+                buf = None
 
             # body
             if not self.is_head:
                 iter = self.body_iter()
-                async for body in iter:
-                    if isinstance(body, str):  # pragma: no cover
-                        body = body.encode()
-                    try:
+                try:
+                    async for body in iter:
+                        if isinstance(body, str):  # pragma: no cover
+                            body = body.encode()
+                        if self.chunked:
+                            if not body:
+                                # an empty chunk would end the body
+                                continue
+                            body = '{:x}\r\n'.format(len(body)).encode() + \
+                                body + b'\r\n'
+                        if buf is not None:
+                            # send a small first chunk in the same write as
+                            # the headers
+                            if len(body) <= self.max_coalesce_length:
+                                buf += body
+                                body = buf
+                            else:
+                                await stream.awrite(buf)
+                            buf = None
                         await stream.awrite(body)
-                    except OSError as exc:  # pragma: no cover
-                        if exc.errno in MUTED_SOCKET_ERRORS or \
-                                exc.args[0] == 'Connection lost':
-                            if hasattr(iter, 'aclose'):
-                                await iter.aclose()
-                        raise
-                if hasattr(iter, 'aclose'):  # pragma: no branch
-                    await iter.aclose()
+                finally:
+                    # also when the write fails or the task is cancelled, so
+                    # the body always releases what it holds
+                    if hasattr(iter, 'aclose'):  # pragma: no branch
+                        await iter.aclose()
+                if self.chunked:
+                    # last chunk, with no trailers
+                    buf = bytearray(b'0\r\n\r\n') if buf is None \
+                        else buf + b'0\r\n\r\n'
+            if buf is not None:
+                # no body was sent
+                await stream.awrite(buf)
 
         except OSError as exc:  # pragma: no cover
             if exc.errno in MUTED_SOCKET_ERRORS or \
@@ -821,6 +923,12 @@ class Response:
             headers['Content-Encoding'] = compressed \
                 if isinstance(compressed, str) else 'gzip'
 
+        if stream is None:
+            try:
+                headers['Content-Length'] = str(
+                    os.stat(filename + file_extension)[6])
+            except OSError:  # pragma: no cover
+                pass
         f = stream or open(filename + file_extension, 'rb')
         return cls(body=f, status_code=status_code, headers=headers)
 
@@ -926,6 +1034,120 @@ class URLPattern():
         return 'URLPattern: {}'.format(self.url_pattern)
 
 
+class RouteIndex():
+    """A lookup structure for the URL map of an application.
+
+    Static routes are found with a dictionary lookup and routes made of
+    ``string``, ``int`` and trailing ``path`` segments with a segment trie,
+    without running their regular expressions. Any other route (regular
+    expression or custom segment types) is matched with its
+    :class:`URLPattern` as before.
+
+    :param url_map: The URL map to index, as a list of ``(methods,
+                    pattern, handler, url_prefix, subapp)`` tuples.
+    """
+    _builtin = {
+        'string': '/([^/]+)',
+        'int': '/(-?\\d+)',
+        'path': '/(.+)',
+    }
+
+    def __init__(self, url_map):
+        self.size = len(url_map)
+        self.static = {}
+        # trie nodes: [static children, parameter child, trailing path
+        # route indexes, indexes of routes ending at this node]
+        self.trie = [{}, None, [], []]
+        self.fallback = []
+        for i, route in enumerate(url_map):
+            self._add(i, route[1])
+
+    def _add(self, i, pattern):
+        url_pattern = pattern.url_pattern
+        segments = url_pattern.lstrip('/').split('/')
+        if '<' not in url_pattern:
+            self.static.setdefault('/' + '/'.join(segments), []).append(i)
+            return
+        node = self.trie
+        for n, segment in enumerate(segments):
+            if segment[:1] != '<':
+                node = node[0].setdefault(segment, [{}, None, [], []])
+                continue
+            segment = segment[1:-1] if segment[-1:] == '>' else ''
+            type_ = segment.rsplit(':', 1)[0] if ':' in segment else 'string'
+            # regular expression and custom segment types are not indexed
+            if not segment or type_.startswith('re:') or \
+                    type_ not in self._builtin or \
+                    URLPattern.segment_patterns.get(type_) != \
+                    self._builtin[type_]:
+                self.fallback.append(i)
+                return
+            if type_ == 'path':
+                if n != len(segments) - 1:
+                    self.fallback.append(i)
+                    return
+                node[2].append(i)
+                return
+            if node[1] is None:
+                node[1] = [{}, None, [], []]
+            node = node[1]
+        node[3].append(i)
+
+    def _walk(self, node, segments, n, values, found):
+        if n == len(segments):
+            for i in node[3]:
+                found.append((i, values))
+            return
+        segment = segments[n]
+        if segment in node[0]:
+            self._walk(node[0][segment], segments, n + 1, values, found)
+        if node[1] is not None and segment:
+            self._walk(node[1], segments, n + 1, values + [segment], found)
+        if node[2]:
+            rest = '/'.join(segments[n:])
+            if rest:
+                for i in node[2]:
+                    found.append((i, values + [rest]))
+
+    def match(self, url_map, path):
+        """Return the routes that match a path.
+
+        The result is a list of ``(index, args)`` tuples in URL map order,
+        where ``args`` has the values of the dynamic path segments.
+        """
+        matches = [(i, {}) for i in self.static.get(path, ())]
+        found = []
+        if path[:1] == '/':
+            self._walk(self.trie, path[1:].split('/'), 0, [], found)
+        for i, values in found:
+            pattern = url_map[i][1]
+            if pattern.regex is None:
+                pattern.compile()
+            args = {}
+            for segment, value in zip(
+                    [s for s in pattern.segments if 'name' in s], values):
+                if segment['type'] == 'int':
+                    digits = value[1:] if value[:1] == '-' else value
+                    if not digits or not digits.isdigit():
+                        args = None
+                        break
+                if segment['parser']:
+                    value = segment['parser'](value)
+                    if value is None:
+                        args = None
+                        break
+                args[segment['name']] = value
+            if args is not None:
+                matches.append((i, args))
+        for i in self.fallback:
+            args = url_map[i][1].match(path)
+            if args is not None:
+                matches.append((i, args))
+        if len(matches) > 1:
+            matches.sort(key=lambda m: m[0])
+        return matches
+
+
 class HTTPException(Exception):
     def __init__(self, status_code, reason=None):
         self.status_code = status_code
@@ -949,6 +1171,35 @@ class Microdot:
         app = Microdot()
     """
 
+    #: Seconds an idle keep-alive connection is held open waiting for the
+    #: next request.
+    keep_alive_timeout = 5
+
+    #: Maximum number of requests served on one connection before it is
+    #: closed. Set to 1 to disable keep-alive.
+    max_keep_alive_requests = 100
+
+    #: Maximum number of connections served at the same time. Connections
+    #: over the limit get a ``503`` response without their request being
+    #: read. ``None`` disables the limit.
+    max_connections = None
+
+    #: Sustained requests per second allowed from one client address, with
+    #: bursts of up to ``max_request_burst`` requests. Requests over the
+    #: limit get a ``429`` response. ``None`` disables the limit.
+    max_request_rate = None
+    max_request_burst = 10
+
+    #: Free heap in bytes below which requests get a ``503`` response
+    #: instead of being read, after a garbage collection fails to free
+    #: enough. Only checked where ``gc.mem_free()`` exists (MicroPython).
+    #: ``None`` disables the check.
+    min_free_memory = None
+
+    #: Seconds allowed to receive the first request on a connection,
+    #: including headers and a buffered body. ``None`` waits forever.
+    request_timeout = None
+
     def __init__(self):
         self.url_map = []
         self.before_request_handlers = []
@@ -956,6 +1207,9 @@ class Microdot:
         self.after_error_request_handlers = []
         self.error_handlers = {}
         self.options_handler = self.default_options_handler
+        self.route_index = None
+        self.connections = 0
+        self._request_rates = {}
         self.ssl = False
         self.debug = False
         self.server = None
@@ -1358,6 +1612,17 @@ class Microdot:
         """
         self.server.close()
 
+    def match_routes(self, path):
+        """Return the ``(index, args)`` tuples of all the routes in the URL
+        map that match a path, in URL map order.
+
+        The route index is rebuilt whenever routes are added.
+        """
+        if self.route_index is None or \
+                self.route_index.size != len(self.url_map):
+            self.route_index = RouteIndex(self.url_map)
+        return self.route_index.match(self.url_map, path)
+
     def find_route(self, req):
         method = req.method.upper()
         if method == 'OPTIONS' and self.options_handler:
@@ -1367,56 +1632,149 @@ class Microdot:
         f = 404
         p = ''
         s = None
-        for route_methods, route_pattern, route_handler, url_prefix, subapp \
-                in self.url_map:
-            req.url_args = route_pattern.match(req.path)
-            if req.url_args is not None:
-                p = url_prefix
-                s = subapp
-                if method in route_methods:
-                    f = route_handler
-                    break
-                else:
-                    f = 405
+        req.url_args = None
+        for i, args in self.match_routes(req.path):
+            route_methods, _, route_handler, url_prefix, subapp = \
+                self.url_map[i]
+            req.url_args = args
+            p = url_prefix
+            s = subapp
+            if method in route_methods:
+                f = route_handler
+                break
+            else:
+                f = 405
         return f, p, s
 
     def default_options_handler(self, req):
         allow = []
-        for route_methods, route_pattern, _, _, _ in self.url_map:
-            if route_pattern.match(req.path) is not None:
-                allow.extend(route_methods)
+        for i, _ in self.match_routes(req.path):
+            allow.extend(self.url_map[i][0])
         if 'GET' in allow:
             allow.append('HEAD')
         allow.append('OPTIONS')
         return {'Allow': ', '.join(allow)}
 
+    def low_memory(self):
+        """Return ``True`` if the free heap is below ``min_free_memory``
+        even after a garbage collection."""
+        if self.min_free_memory is None or not hasattr(gc, 'mem_free'):
+            return False
+        if gc.mem_free() >= self.min_free_memory:  # type: ignore
+            return False
+        gc.collect()
+        return gc.mem_free() < self.min_free_memory  # type: ignore
+
+    def allow_request(self, client_addr):
+        """Take a token from the client's bucket for ``max_request_rate``.
+        Return ``False`` if the client is over the limit."""
+        if not self.max_request_rate:
+            return True
+        host = client_addr[0] if isinstance(client_addr, tuple) \
+            else client_addr
+        now = ticks_ms()
+        rates = self._request_rates
+        if host not in rates and len(rates) >= 32:
+            # forget clients whose buckets have refilled
+            full_ms = self.max_request_burst * 1000 / self.max_request_rate
+            self._request_rates = rates = {
+                h: v for h, v in rates.items()
+                if ticks_diff(now, v[1]) < full_ms}
+            if len(rates) >= 32:  # pragma: no cover
+                rates.clear()
+        tokens, last = rates.get(host, (self.max_request_burst, now))
+        tokens = min(self.max_request_burst, tokens + ticks_diff(
+            now, last) * self.max_request_rate / 1000)
+        if tokens < 1:
+            rates[host] = (tokens, now)
+            return False
+        rates[host] = (tokens - 1, now)
+        return True
+
     async def handle_request(self, reader, writer):
-        req = None
+        if (self.max_connections is not None and
+                self.connections >= self.max_connections) or \
+                self.low_memory():
+            # shed the connection before reading anything from it
+            try:
+                await Response('Service unavailable', 503,
+                               {'Retry-After': '1'},
+                               reason='Service Unavailable').write(writer)
+                await writer.aclose()
+            except OSError as exc:  # pragma: no cover
+                if exc.errno not in MUTED_SOCKET_ERRORS:
+                    raise
+            return
+        self.connections += 1
         try:
-            req = await Request.create(self, reader, writer,
-                                       writer.get_extra_info('peername'))
-        except OSError as exc:  # pragma: no cover
-            if exc.errno in MUTED_SOCKET_ERRORS:
-                pass
-            else:
-                raise
-        except Exception as exc:  # pragma: no cover
-            print_exception(exc)
+            await self._handle_connection(reader, writer)
+        finally:
+            self.connections -= 1
 
-        res = await self.dispatch_request(req)
+    async def _handle_connection(self, reader, writer):
+        served = 0
+        while True:
+            req = None
+            if served and self.low_memory():
+                break
+            try:
+                create = Request.create(self, reader, writer,
+                                        writer.get_extra_info('peername'))
+                if served:
+                    # an idle keep-alive connection
+                    req = await asyncio.wait_for(create,
+                                                 self.keep_alive_timeout)
+                elif self.request_timeout is not None:
+                    req = await asyncio.wait_for(create,
+                                                 self.request_timeout)
+                else:
+                    req = await create
+            except asyncio.TimeoutError:
+                break
+            except OSError as exc:  # pragma: no cover
+                if exc.errno in MUTED_SOCKET_ERRORS:
+                    pass
+                else:
+                    raise
+            except Exception as exc:  # pragma: no cover
+                print_exception(exc)
+            if req is None and served:
+                # the client closed the connection between requests
+                break
+            served += 1
+
+            if req is not None and not self.allow_request(req.client_addr):
+                res = Response('Too many requests', 429, {'Retry-After': '1'},
+                               reason='Too Many Requests')
+            else:
+                res = await self.dispatch_request(req)
+            keep_alive = False
+            try:
+                if res != Response.already_handled:  # pragma: no branch
+                    res.keep_alive = req is not None and req.keep_alive and \
+                        served < self.max_keep_alive_requests
+                    res.chunked = req is not None and \
+                        req.http_version != '1.0'
+                    await res.write(writer)
+                    keep_alive = res.keep_alive
+            except OSError as exc:  # pragma: no cover
+                if exc.errno in MUTED_SOCKET_ERRORS:
+                    pass
+                else:
+                    raise
+            if self.debug and req:  # pragma: no cover
+                print('{method} {path} {status_code}'.format(
+                    method=req.method, path=req.path,
+                    status_code=res.status_code))
+            if not keep_alive:
+                break
         try:
-            if res != Response.already_handled:  # pragma: no branch
-                await res.write(writer)
             await writer.aclose()
         except OSError as exc:  # pragma: no cover
             if exc.errno in MUTED_SOCKET_ERRORS:
                 pass
             else:
                 raise
-        if self.debug and req:  # pragma: no cover
-            print('{method} {path} {status_code}'.format(
-                method=req.method, path=req.path,
-                status_code=res.status_code))
 
     def get_request_handlers(self, req, attr, local_first=True):
         handlers = getattr(self, attr + '_handlers')
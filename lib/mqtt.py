@@ -0,0 +1,271 @@
+# lib/mqtt.py - Minimal async MQTT 3.1.1 client on uasyncio streams
+import struct
+import time
+import uasyncio as asyncio
+from micropython import const
+
+from lib.log import log
+
+# Control packet types (upper nibble of the fixed header)
+_CONNECT = const(0x10)
+_CONNACK = const(0x20)
+_PUBLISH = const(0x30)
+_PUBACK = const(0x40)
+_SUBSCRIBE = const(0x82)
+_SUBACK = const(0x90)
+_PINGREQ = const(0xC0)
+_PINGRESP = const(0xD0)
+_DISCONNECT = const(0xE0)
+
+
+def _encode_str(s):
+    if isinstance(s, str):
+        s = s.encode()
+    return struct.pack('!H', len(s)) + s
+
+
+def _encode_length(n):
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return out
+
+
+class MQTTClient:
+    """
+    An async MQTT 3.1.1 client with QoS 0/1 publishing, a bounded QoS 1
+    in-flight window, keepalive pings and automatic reconnection.
+
+    With clean_session=False the broker keeps our subscriptions and queued
+    messages across reconnects, and unacknowledged QoS 1 publishes are
+    retransmitted with the DUP flag once the session is resumed.
+
+    `open_connection` defaults to asyncio.open_connection and can be
+    replaced with any coroutine returning a (reader, writer) pair.
+    """
+
+    def __init__(self, client_id, server, port=1883, user=None, password=None,
+                 keepalive=60, clean_session=False, max_inflight=4,
+                 open_connection=None):
+        self.client_id = client_id
+        self.server = server
+        self.port = port
+        self.user = user
+        self.password = password
+        self.keepalive = keepalive
+        self.clean_session = clean_session
+        self.max_inflight = max_inflight
+        self._open_connection = open_connection or asyncio.open_connection
+        self.on_message = None
+        self.on_connect = None
+        self._subscriptions = []
+        self._reader = None
+        self._writer = None
+        self._write_lock = asyncio.Lock()
+        self._inflight = {}
+        self._window = asyncio.Event()
+        self._connected = asyncio.Event()
+        self._pid = 0
+        self._last_rx = 0
+        self.published = 0
+        self.received = 0
+        self.reconnects = 0
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    def _next_pid(self):
+        while True:
+            self._pid = self._pid % 0xFFFF + 1
+            if self._pid not in self._inflight:
+                return self._pid
+
+    async def _write(self, data):
+        async with self._write_lock:
+            self._writer.write(data)
+            await self._writer.drain()
+
+    async def _read_packet(self):
+        header = (await self._reader.readexactly(1))[0]
+        length = 0
+        shift = 0
+        while True:
+            byte = (await self._reader.readexactly(1))[0]
+            length |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                break
+            shift += 7
+        payload = await self._reader.readexactly(length) if length else b''
+        self._last_rx = time.time()
+        return header, payload
+
+    async def _connect(self):
+        self._reader, self._writer = await self._open_connection(self.server, self.port)
+        flags = 0x02 if self.clean_session else 0
+        payload = _encode_str(self.client_id)
+        if self.user is not None:
+            flags |= 0x80
+            payload += _encode_str(self.user)
+            if self.password is not None:
+                flags |= 0x40
+                payload += _encode_str(self.password)
+        var_header = _encode_str('MQTT') + bytes([4, flags]) + struct.pack('!H', self.keepalive)
+        body = var_header + payload
+        await self._write(bytes([_CONNECT]) + _encode_length(len(body)) + body)
+
+        header, payload = await asyncio.wait_for(self._read_packet(), 10)
+        if header != _CONNACK or len(payload) != 2:
+            raise OSError("Unexpected reply to CONNECT")
+        if payload[1] != 0:
+            raise OSError(f"Connection refused by broker, code {payload[1]}")
+        session_present = payload[0] & 0x01
+
+        if not session_present:
+            for topic, qos in self._subscriptions:
+                await self._send_subscribe(topic, qos)
+        # Retransmit anything the broker never acknowledged
+        for pid, (topic, msg, retain) in list(self._inflight.items()):
+            await self._send_publish(topic, msg, retain, 1, pid, dup=True)
+        self._connected.set()
+        if self.on_connect:
+            await self.on_connect(session_present)
+
+    async def _send_publish(self, topic, msg, retain, qos, pid=0, dup=False):
+        if isinstance(msg, str):
+            msg = msg.encode()
+        var_header = _encode_str(topic)
+        if qos:
+            var_header += struct.pack('!H', pid)
+        header = _PUBLISH | (qos << 1) | (0x08 if dup else 0) | (0x01 if retain else 0)
+        await self._write(bytes([header]) + _encode_length(len(var_header) + len(msg)) + var_header + msg)
+
+    async def _send_subscribe(self, topic, qos):
+        body = struct.pack('!H', self._next_pid()) + _encode_str(topic) + bytes([qos])
+        await self._write(bytes([_SUBSCRIBE]) + _encode_length(len(body)) + body)
+
+    async def publish(self, topic, msg, retain=False, qos=0):
+        """
+        Publishes a message. QoS 1 messages wait only for a free slot in the
+        in-flight window, not for their own acknowledgement, so a burst of
+        publishes is pipelined over the connection.
+        """
+        if qos:
+            while len(self._inflight) >= self.max_inflight:
+                self._window.clear()
+                await self._window.wait()
+            pid = self._next_pid()
+            self._inflight[pid] = (topic, msg, retain)
+        else:
+            pid = 0
+        if not self.connected:
+            if qos:
+                return  # retransmitted from _inflight once reconnected
+            raise OSError("MQTT not connected")
+        try:
+            await self._send_publish(topic, msg, retain, qos, pid)
+        except OSError:
+            if not qos:
+                raise
+        self.published += 1
+
+    async def subscribe(self, topic, qos=1):
+        """Subscribes to a topic. Subscriptions are restored on reconnect."""
+        self._subscriptions.append((topic, qos))
+        if self.connected:
+            await self._send_subscribe(topic, qos)
+
+    async def _handle_packets(self):
+        while True:
+            header, payload = await self._read_packet()
+            kind = header & 0xF0
+            if kind == _PUBACK:
+                pid = struct.unpack('!H', payload)[0]
+                if self._inflight.pop(pid, None) is not None:
+                    self._window.set()
+            elif kind == _PUBLISH:
+                qos = (header >> 1) & 0x03
+                tlen = struct.unpack('!H', payload[:2])[0]
+                topic = payload[2:2 + tlen].decode()
+                pos = 2 + tlen
+                if qos:
+                    pid = payload[pos:pos + 2]
+                    pos += 2
+                    await self._write(bytes([_PUBACK, 2]) + pid)
+                self.received += 1
+                if self.on_message:
+                    # Run the handler on its own task so that PUBACKs keep
+                    # flowing if it publishes in turn.
+                    asyncio.create_task(self._dispatch(topic, payload[pos:]))
+            # SUBACK and PINGRESP only need to refresh _last_rx
+
+    async def _dispatch(self, topic, msg):
+        try:
+            await self.on_message(topic, msg)
+        except Exception as e:
+            log(f"MQTT: message handler error: {e}")
+
+    async def _keepalive(self):
+        try:
+            while True:
+                await asyncio.sleep(self.keepalive // 2 or 1)
+                if time.time() - self._last_rx > self.keepalive * 3 // 2:
+                    raise OSError("MQTT keepalive timeout")
+                await self._write(bytes([_PINGREQ, 0]))
+        except OSError as e:
+            # Closing the stream unblocks the packet reader in run()
+            log(f"MQTT: {e}")
+            await self._close()
+
+    async def _close(self):
+        self._connected.clear()
+        if self._writer:
+            try:
+                self._writer.close()
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+        self._reader = self._writer = None
+
+    async def run(self):
+        """Connects and keeps the session alive forever, reconnecting with
+        exponential backoff. Start it with asyncio.create_task()."""
+        delay = 1
+        while True:
+            try:
+                await self._connect()
+                log(f"MQTT: connected to {self.server}:{self.port}")
+                delay = 1
+                pinger = asyncio.create_task(self._keepalive())
+                try:
+                    await self._handle_packets()
+                finally:
+                    pinger.cancel()
+            except Exception as e:
+                log(f"MQTT: connection lost: {e}")
+            await self._close()
+            self.reconnects += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
+
+    async def disconnect(self):
+        if self.connected:
+            try:
+                await self._write(bytes([_DISCONNECT, 0]))
+            except Exception:
+                pass
+        await self._close()
+
+    def stats(self):
+        return {
+            'connected': self.connected,
+            'inflight': len(self._inflight),
+            'published': self.published,
+            'received': self.received,
+            'reconnects': self.reconnects,
+        }
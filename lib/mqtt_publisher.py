@@ -0,0 +1,89 @@
+# lib/mqtt_publisher.py - Change-based MQTT telemetry for the data collector
+import ujson
+import uasyncio as asyncio
+
+from lib.log import log
+from lib.report_policy import ReportPolicy
+
+
+class MQTTPublisher:
+    """
+    Publishes collected samples over an MQTTClient.
+
+    Each field goes to its own retained topic `<prefix>/<field>`, but only
+    when the ReportPolicy says it changed enough since it was last
+    published. On every policy keyframe all fields are republished and a
+    full JSON snapshot goes to `<prefix>/state`. Messages on
+    `<prefix>/set` are JSON objects such as {"mode": 1, "priority": 0}
+    and are passed to `command_handler`.
+    """
+
+    def __init__(self, client, prefix='npbc', snapshot_interval=300,
+                 command_handler=None, qos=1, policy=None):
+        self.client = client
+        self.prefix = prefix.rstrip('/')
+        self.policy = policy or ReportPolicy(keyframe_interval=snapshot_interval)
+        self.command_handler = command_handler
+        self.qos = qos
+        self._latest = None
+        self._event = asyncio.Event()
+        client.on_message = self._on_message
+        client.on_connect = self._on_connect
+
+    def update(self, data):
+        """Hands a new sample to the publisher. Never blocks."""
+        self._latest = data
+        self._event.set()
+
+    async def _on_connect(self, session_present):
+        # Make sure the state topic is fresh after an outage.
+        self.policy.force_keyframe()
+        self._event.set()
+
+    async def _on_message(self, topic, msg):
+        if topic != f'{self.prefix}/set' or not self.command_handler:
+            return
+        try:
+            cmd = ujson.loads(msg)
+            mode, priority = int(cmd['mode']), int(cmd['priority'])
+        except (ValueError, KeyError, TypeError):
+            log(f"MQTT: ignoring malformed command: {msg}")
+            return
+        log(f"MQTT: command mode={mode} priority={priority}")
+        data = await self.command_handler(mode, priority)
+        # The handler returns the burner read-back; merge it into the last
+        # full sample. Before the first sample there is nothing to merge
+        # into, and a burner-only snapshot would be kept as the retained
+        # state, so the read-back waits for the data collector instead.
+        if data and self._latest is not None:
+            merged = dict(self._latest)
+            merged.update(data)
+            self.update(merged)
+
+    async def _publish_changes(self, data):
+        fields, keyframe = self.policy.filter(data)
+        for key, value in fields.items():
+            await self.client.publish(f'{self.prefix}/{key}', ujson.dumps(value),
+                                      retain=True, qos=self.qos)
+        if keyframe:
+            await self.client.publish(f'{self.prefix}/state', ujson.dumps(data),
+                                      retain=True, qos=self.qos)
+
+    async def run(self):
+        """Publishes samples as they arrive. Start it with asyncio.create_task()."""
+        await self.client.subscribe(f'{self.prefix}/set', qos=1)
+        asyncio.create_task(self.client.run())
+        while True:
+            await self._event.wait()
+            self._event.clear()
+            if not self.client.connected or self._latest is None:
+                continue
+            try:
+                await self._publish_changes(self._latest)
+            except OSError as e:
+                log(f"MQTT: publish failed: {e}")
+
+    def stats(self):
+        stats = self.client.stats()
+        stats['suppressed'] = self.policy.suppressed
+        return stats
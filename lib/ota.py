@@ -1,29 +1,101 @@
 # lib/ota.py
+import sys
 import uos
 import ujson
-import urequests as requests
 import machine
 import gc
-import time # Import time for sleeping
-from micropython import const
+import hashlib
+import binascii
+import uasyncio as asyncio
+from lib.http_client import HTTPClient
+from lib.ota_stage import OTAStage
+from lib.ota_bundle import BundleReader, NAME as BUNDLE_NAME, bundle_name, mpy_manifest
+
+
+def _mpy_version():
+    """The .mpy bytecode version this firmware runs, e.g. '6.3'."""
+    mpy = getattr(sys.implementation, '_mpy', None)
+    if mpy is None:
+        return None
+    return f'{mpy & 0xff}.{mpy >> 8 & 3}'
+
+
+class GitHubSource:
+    """
+    Where releases come from: the GitHub API for the latest release and
+    raw.githubusercontent.com for the files of a tag. Bundle URLs are
+    taken from the release's assets.
+    """
+    api_base = 'https://api.github.com'
+    raw_base = 'https://raw.githubusercontent.com'
+
+    def latest_url(self, repo):
+        return f'{self.api_base}/repos/{repo}/releases/latest'
+
+    def raw_url(self, repo, version, path):
+        return f'{self.raw_base}/{repo}/{version}/{path}'
+
+
+class MirrorSource(GitHubSource):
+    """
+    A LAN mirror (tools/ota_mirror.py) serving GitHub's layout under one
+    base URL: /repos/<repo>/releases/latest and /<repo>/<tag>/<path>.
+    """
+
+    def __init__(self, base_url):
+        self.api_base = self.raw_base = base_url.rstrip('/')
+
 
 class OTAUpdater:
     """
     A class to manage Over-The-Air updates for a MicroPython application
-    with robust error handling, timeouts, and content validation.
+    with robust error handling, timeouts, and content validation. Releases
+    are read from GitHub, or from the given `source` such as a
+    MirrorSource.
+
+    The update runs as a cooperative uasyncio job so that the rest of the
+    application keeps running while files download: start() launches it
+    in the background and `status` reports its progress.
+
+    Files are downloaded into an OTAStage and only moved into place by
+    boot.py after the reboot, so an interrupted download never leaves a
+    mix of old and new files. Releases that carry an ota.bundle asset
+    (tools/make_bundle.py) are fetched in one download; others file by
+    file from raw.githubusercontent.com. If the release was precompiled
+    (tools/build_mpy.py) for this firmware's bytecode version, .mpy files
+    are installed instead of the module sources.
+
+    run_checks() polls for new releases in the background. The release
+    data is cached with its ETag in _RELEASE_FILE, so repeated checks are
+    answered with 304 Not Modified, and `latest_version` is known right
+    after a reboot without any network request.
     """
     _TIMEOUT = 10
     _MAX_RETRIES = 3
+    _RETRY_DELAY = 2
+    _REBOOT_DELAY = 3
+    _CHUNK_SIZE = 1024
+    _MAX_REDIRECTS = 5
+    _INDEX_FILE = '.ota_index.json'
+    _RELEASE_FILE = '.ota_release.json'
     _HEADERS = {'User-Agent': 'micropython-ota'}
+    _RUNNING = ('checking', 'downloading', 'installing')
 
-    def __init__(self, github_repo, module='', main_dir='main'):
-        self._TIMEOUT = 10
+    def __init__(self, github_repo, module='', main_dir='main', client=None, stage=None,
+                 use_mpy=True, source=None):
         self.github_repo = github_repo.rstrip('/').replace('https://github.com/', '')
         if len(self.github_repo.split('/')) != 2:
             raise ValueError("Invalid GitHub repository URL format. Expected 'user/repo'.")
         self._main_dir = main_dir
         self._module = module.strip('/')
-        self._raw_base = f'https://raw.githubusercontent.com/{self.github_repo}'
+        self._source = source or GitHubSource()
+        # One pooled connection per host: all files of an update share a
+        # single TLS handshake to raw.githubusercontent.com.
+        self._client = client or HTTPClient(timeout=self._TIMEOUT, headers=self._HEADERS)
+        self._stage = stage or OTAStage(main_dir)
+        self._task = None
+        self._bundle_url = None
+        self._mpy = _mpy_version() if use_mpy else None
         try:
             with open(self._main_dir + '/main.json', 'r') as f:
                 self.current_version = ujson.load(f)['version']
@@ -31,136 +103,493 @@ class OTAUpdater:
         except (OSError, ValueError, KeyError):
             print("No valid version file found. Setting version to 0.")
             self.current_version = "0"
+        self._release = self._load_release()
+        self.latest_version = self._release['release']['tag_name'] if self._release else None
+        self.status = {}
+        self._set_status('idle')
+
+    def _set_status(self, state, message='', **fields):
+        """Replaces the progress report returned by /api/update/status."""
+        if state != self.status.get('state') and state in ('checking', 'idle'):
+            self.status = {
+                'current_version': self.current_version,
+                'latest_version': None,
+                'file': None,
+                'files_done': 0,
+                'files_total': 0,
+                'files_skipped': 0,
+                'bytes': 0,
+                'errors': [],
+            }
+        self.status['state'] = state
+        self.status['message'] = message
+        self.status.update(fields)
+
+    def _error(self, message):
+        print(message)
+        self.status['errors'].append(message)
+
+    @property
+    def running(self):
+        return self.status['state'] in self._RUNNING
+
+    @property
+    def update_available(self):
+        """Whether the last check found a newer release."""
+        return self.latest_version is not None and self.latest_version > self.current_version
+
+    def start(self):
+        """Starts the update job in the background. Returns False if one is
+        already running."""
+        if self.running:
+            return False
+        self._set_status('checking', 'Checking for updates...')
+        self._task = asyncio.create_task(self._job())
+        return True
+
+    async def _job(self):
+        try:
+            success, message = await self.download_and_install_update_if_available()
+        except Exception as e:
+            success, message = False, f"Update failed: {e}"
+        finally:
+            await self._client.close()
+            gc.collect()
+        if success:
+            self._set_status('rebooting', message)
+            await asyncio.sleep(self._REBOOT_DELAY)
+            machine.reset()
+        elif self.status['state'] != 'up_to_date':
+            self._set_status('error', message)
 
     def _raw_url(self, version, path):
-        """Build a raw.githubusercontent.com URL, avoiding double slashes."""
-        parts = [self._raw_base, version]
+        """Build the URL of a release file, avoiding double slashes."""
         if self._module:
-            parts.append(self._module)
-        parts.append(path)
-        return '/'.join(parts)
-
-    def _request_json(self, url):
-        """Perform a robust GET request expecting a JSON response, with retries for busy network."""
-        gc.collect()
+            path = self._module + '/' + path
+        return self._source.raw_url(self.github_repo, version, path)
 
+    async def _get(self, url, headers=None):
+        """GET with retries on network errors. Returns (response, message);
+        the caller must close the response."""
         for attempt in range(self._MAX_RETRIES):
+            gc.collect()
+            try:
+                return await self._client.get(url, headers=headers,
+                                              redirects=self._MAX_REDIRECTS), "OK"
+            except Exception as e:
+                if attempt < self._MAX_RETRIES - 1:
+                    self._error(f"Network error, retrying in {self._RETRY_DELAY} seconds... "
+                                f"(Attempt {attempt + 1}/{self._MAX_RETRIES}): {e}")
+                    await asyncio.sleep(self._RETRY_DELAY)
+                else:
+                    return None, f"Network error: {e}"
+
+    async def _request_json(self, url):
+        """Perform a GET request expecting a JSON response, with retries."""
+        response, msg = await self._get(url)
+        if response is None:
+            return None, msg
+        try:
+            if response.status_code != 200:
+                print(f"Error: Received status {response.status_code} from {url}")
+                return None, f"HTTP Error {response.status_code}"
             try:
-                response = requests.get(url, headers=self._HEADERS, timeout=self._TIMEOUT)
-                if response.status_code != 200:
-                    print(f"Error: Received status {response.status_code} from {url}")
-                    return None, f"HTTP Error {response.status_code}"
+                return await response.json(), "OK"
+            except ValueError:
+                print("Error: Invalid JSON response.")
+                return None, "Invalid JSON response"
+        finally:
+            await response.aclose()
+
+    def _load_release(self):
+        """Returns the cached {'etag': ..., 'release': ...}, or None."""
+        try:
+            with open(self._main_dir + '/' + self._RELEASE_FILE, 'r') as f:
+                cached = ujson.load(f)
+            cached['release']['tag_name']
+            return cached
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _save_release(self, etag, release):
+        self._release = {'etag': etag, 'release': release}
+        try:
+            with open(self._main_dir + '/' + self._RELEASE_FILE, 'w') as f:
+                ujson.dump(self._release, f)
+        except OSError as e:
+            print(f"Failed to save release cache: {e}")
+
+    async def _get_latest_version(self):
+        """Fetch the latest release version tag from GitHub, and note the
+        release's bundle asset if it has one. Sends the cached ETag, so an
+        unchanged release costs a 304 without a body."""
+        url = self._source.latest_url(self.github_repo)
+        cached = self._release
+        headers = {'If-None-Match': cached['etag']} if cached and cached.get('etag') else None
+        response, msg = await self._get(url, headers)
+        if response is None:
+            return None, msg
+        try:
+            if response.status_code == 304 and cached:
+                release = cached['release']
+            elif response.status_code == 200:
                 try:
-                    json_data = response.json()
-                    return json_data, "OK"
+                    json_data = await response.json()
                 except ValueError:
                     print("Error: Invalid JSON response.")
                     return None, "Invalid JSON response"
+                if 'tag_name' not in json_data:
+                    return None, "Malformed release data: 'tag_name' missing"
+                # keep only what the updater needs; the full release is several KB
+                release = {
+                    'tag_name': json_data['tag_name'],
+                    'assets': {asset.get('name'): asset.get('browser_download_url')
+                               for asset in json_data.get('assets') or ()},
+                }
+                del json_data
+                self._save_release(response.headers.get('etag'), release)
+            else:
+                print(f"Error: Received status {response.status_code} from {url}")
+                return None, f"HTTP Error {response.status_code}"
+        finally:
+            await response.aclose()
+        urls = release['assets']
+        self._bundle_url = None
+        if self._mpy:
+            self._bundle_url = urls.get(bundle_name(self._mpy))
+        self._bundle_url = self._bundle_url or urls.get(BUNDLE_NAME)
+        self.latest_version = release['tag_name']
+        return release['tag_name'], "OK"
+
+    async def check(self):
+        """Refreshes `latest_version` without installing anything. Returns
+        it, or None if the check failed."""
+        if self.running:
+            return self.latest_version
+        try:
+            version, msg = await self._get_latest_version()
+        except Exception as e:
+            version, msg = None, e
+        finally:
+            # do not hold a TLS connection until the next check
+            await self._client.close()
+        if version is None:
+            print(f"Update check failed: {msg}")
+        return version
+
+    async def run_checks(self, interval, first_delay=60):
+        """Checks for a new release every `interval` seconds, starting
+        `first_delay` seconds from now."""
+        await asyncio.sleep(first_delay)
+        while True:
+            await self.check()
+            await asyncio.sleep(interval)
+
+    def _makedirs(self, path):
+        """Creates the parent directories of `path`."""
+        path_parts = path.split('/')
+        for i in range(1, len(path_parts)):
+            if not path_parts[i - 1]:
+                continue  # leading '/'
+            try: uos.mkdir('/'.join(path_parts[:i]))
             except OSError as e:
-                if e.args[0] == 16:  # uerrno.EBUSY
-                    print(f"Network busy, retrying in 2 seconds... (Attempt {attempt + 1}/{self._MAX_RETRIES})")
-                    time.sleep(2)
+                if e.args[0] != 17: raise
+
+    async def _download_file(self, url, file, sha256=None, path=None):
+        """
+        Streams one file into the stage (or to `path`) in _CHUNK_SIZE
+        pieces, hashing it on the way. Returns its SHA-256, or False on HTTP
+        errors; raises on network errors and hash mismatches so that the
+        download is retried.
+        """
+        response, msg = await self._get(url)
+        if response is None:
+            self._error(f"Failed to download {file}: {msg}")
+            return False
+        path = path or self._stage.stage_path(file)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            if response.status_code != 200:
+                self._error(f"Failed to download {file}: HTTP {response.status_code}")
+                return False
+            self._makedirs(path)
+            with open(path, 'wb') as f:
+                while True:
+                    chunk = await response.read(self._CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+                    self.status['bytes'] += len(chunk)
+        except Exception:
+            try: uos.remove(path)
+            except OSError: pass
+            raise
+        finally:
+            await response.aclose()
+        hexdigest = binascii.hexlify(digest.digest()).decode()
+        if sha256 and hexdigest != sha256.lower():
+            uos.remove(path)
+            raise ValueError(f"SHA-256 mismatch for {file} ({size} bytes)")
+        return hexdigest
+
+    def _load_index(self):
+        """Returns the cached {file: [size, mtime, sha256]} of local files."""
+        try:
+            with open(self._main_dir + '/' + self._INDEX_FILE, 'r') as f:
+                return ujson.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, index):
+        try:
+            with open(self._main_dir + '/' + self._INDEX_FILE, 'w') as f:
+                ujson.dump(index, f)
+        except OSError as e:
+            print(f"Failed to save OTA index: {e}")
+
+    def _index_file(self, index, file, sha256=None, path=None):
+        """
+        Returns the SHA-256 of a local file, or None if it does not exist.
+        The hash is taken from the index while the file's size and mtime
+        are unchanged, so unchanged files are not read again. Pass `sha256`
+        and the staged `path` to record a file that was just downloaded;
+        applying it renames it, which keeps its size and mtime.
+        """
+        path = path or self._main_dir + '/' + file
+        try:
+            st = uos.stat(path)
+        except OSError:
+            index.pop(file, None)
+            return None
+        entry = index.get(file)
+        if sha256 is None and entry and entry[0] == st[6] and entry[1] == st[8]:
+            return entry[2]
+        if sha256 is None:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                while True:
+                    chunk = f.read(self._CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+            sha256 = binascii.hexlify(digest.digest()).decode()
+        index[file] = [st[6], st[8], sha256]
+        return sha256
+
+    def _changed_files(self, manifest, index):
+        """Returns the manifest files whose local copy differs. Files
+        without a hash in the manifest are always treated as changed."""
+        hashes = manifest.get('sha256') or {}
+        sizes = manifest.get('size') or {}
+        changed = []
+        for file in manifest['files']:
+            want = hashes.get(file)
+            if not want:
+                changed.append(file)
+                continue
+            if file in sizes:
+                try:
+                    if uos.stat(self._main_dir + '/' + file)[6] != sizes[file]:
+                        changed.append(file)
+                        continue
+                except OSError:
+                    changed.append(file)
                     continue
-                else:
-                    print(f"Network error: {e}")
-                    return None, f"Network error: {e}"
+            if self._index_file(index, file) != want.lower():
+                changed.append(file)
+        return changed
+
+    async def _download_with_retries(self, url, file, sha256=None, path=None):
+        """_download_file() with up to _MAX_RETRIES attempts. Returns the
+        SHA-256, or False once the file cannot be downloaded."""
+        for attempt in range(self._MAX_RETRIES):
+            try:
+                return await self._download_file(url, file, sha256, path)
             except Exception as e:
-                print(f"Request error: {e}")
-                return None, f"Request error: {e}"
-            finally:
-                if 'response' in locals() and response:
-                    response.close()
-
-        # If all retries failed
-        return None, "Network busy after multiple retries"
-
-    # ... (the rest of the OTAUpdater class remains unchanged) ...
-    def _get_latest_version(self):
-        """Fetch the latest release version tag from GitHub."""
-        url = f'https://api.github.com/repos/{self.github_repo}/releases/latest'
-        json_data, msg = self._request_json(url)
-        if json_data is None:
-            return None, msg
-        if 'tag_name' not in json_data:
-            return None, "Malformed release data: 'tag_name' missing"
-        return json_data['tag_name'], "OK"
+                if attempt < self._MAX_RETRIES - 1:
+                    self._error(f"Error downloading {file}: {e}")
+                    await asyncio.sleep(self._RETRY_DELAY)
+                else:
+                    self._error(f"Failed to download {file} after {self._MAX_RETRIES} attempts: {e}")
+        return False
+
+    def _begin_stage(self):
+        if self._stage.on_trial:
+            # the update before this one got far enough to serve this request
+            self._stage.mark_healthy()
+        self._stage.reset()
 
-    def _download_and_install(self, version, files):
-        """Download and install all files for the given version."""
+    async def _download_and_install(self, version, manifest):
+        """Downloads all changed files of the given version into the stage
+        and commits it, so that boot.py installs it on the next boot."""
+        self._begin_stage()
+        hashes = manifest.get('sha256') or {}
+        remote = manifest.get('remote') or {}
+        index = self._load_index()
+        files = self._changed_files(manifest, index)
+        skipped = len(manifest['files']) - len(files)
+        print(f'{len(files)} changed file(s), {skipped} unchanged')
+        self._set_status('downloading', f'Downloading version {version}...',
+                         files_total=len(files), files_skipped=skipped)
         for file in files:
-            url = self._raw_url(version, file)
+            self.status['file'] = file
+            print(f'Downloading {file}')
+            url = self._raw_url(version, remote.get(file, file))
+            sha256 = await self._download_with_retries(url, file, hashes.get(file))
+            if not sha256:
+                self._save_index(index)
+                return False
+            self._index_file(index, file, sha256, self._stage.stage_path(file))
+            self.status['files_done'] += 1
 
-            for attempt in range(self._MAX_RETRIES):
-                gc.collect()
-                print(f'Downloading {file}' + (f' (retry {attempt})' if attempt else ''))
-                try:
-                    response = requests.get(url, headers=self._HEADERS, timeout=self._TIMEOUT)
-                    if response.status_code != 200:
-                        print(f"Failed to download {file}: HTTP {response.status_code}")
-                        return False
-
-                    path_parts = file.split('/')
-                    if len(path_parts) > 1:
-                        dir_path = self._main_dir
-                        for part in path_parts[:-1]:
-                            dir_path += '/' + part
-                            try: uos.mkdir(dir_path)
-                            except OSError as e:
-                                if e.args[0] != 17: raise
-
-                    with open(self._main_dir + '/' + file, 'w') as f:
-                        f.write(response.text)
-
-                    response.close()
-                    break  # success, move to next file
-
-                except Exception as e:
-                    if 'response' in locals():
-                        try: response.close()
-                        except: pass
-                    if attempt < self._MAX_RETRIES - 1:
-                        print(f"Error downloading {file}: {e}")
-                        time.sleep(2)
-                    else:
-                        print(f"Failed to download {file} after {self._MAX_RETRIES} attempts: {e}")
-                        return False
+        self._save_index(index)
+        return self._commit_stage(version, manifest, files)
+
+    async def _install_bundle(self, version):
+        """
+        Downloads the release's ota.bundle in one request, then inflates it
+        file by file into the stage, writing only files that changed. The
+        bundle header is the release's main.json.
+        """
+        self._begin_stage()
+        self._set_status('downloading', f'Downloading version {version}...',
+                         file=BUNDLE_NAME, files_total=1)
+        bundle = self._stage.dir + '/' + BUNDLE_NAME
+        if not await self._download_with_retries(self._bundle_url, BUNDLE_NAME, path=bundle):
+            return False
+        try:
+            with open(bundle, 'rb') as f:
+                reader = BundleReader(f)
+                manifest = reader.manifest
+                hashes = manifest.get('sha256') or {}
+                index = self._load_index()
+                files = self._changed_files(manifest, index)
+                skipped = len(manifest['files']) - len(files)
+                print(f'{len(files)} changed file(s), {skipped} unchanged')
+                self._set_status('installing', 'Unpacking update...', files_done=0,
+                                 files_total=len(files), files_skipped=skipped)
+                for file in manifest['files']:
+                    keep = file in files
+                    self.status['file'] = file if keep else None
+                    sha256 = await self._unpack_file(reader, file, manifest['size'][file],
+                                                     hashes.get(file), keep)
+                    if keep:
+                        self._index_file(index, file, sha256, self._stage.stage_path(file))
+                        self.status['files_done'] += 1
+            self._save_index(index)
+        except Exception as e:
+            self._error(f"Failed to unpack {BUNDLE_NAME}: {e}")
+            return False
+        finally:
+            try: uos.remove(bundle)
+            except OSError: pass
+        return self._commit_stage(version, manifest, files)
+
+    async def _unpack_file(self, reader, file, size, sha256, keep):
+        """Reads the next `size` bytes from the bundle. If `keep`, writes
+        them to the stage and checks their hash, which is returned."""
+        path = self._stage.stage_path(file)
+        digest = hashlib.sha256() if keep else None
+        f = None
+        if keep:
+            self._makedirs(path)
+            f = open(path, 'wb')
+        try:
+            while size:
+                chunk = reader.read(min(size, self._CHUNK_SIZE))
+                if not chunk:
+                    raise ValueError(f"Bundle truncated in {file}")
+                size -= len(chunk)
+                if keep:
+                    digest.update(chunk)
+                    f.write(chunk)
+                # inflating is CPU-bound: let the other tasks run
+                await asyncio.sleep(0)
+        finally:
+            if f:
+                f.close()
+        if not keep:
+            return None
+        hexdigest = binascii.hexlify(digest.digest()).decode()
+        if sha256 and hexdigest != sha256.lower():
+            raise ValueError(f"SHA-256 mismatch for {file}")
+        return hexdigest
 
+    def _stale_files(self, manifest):
+        """Returns the local .py/.mpy twins of manifest modules, which must
+        go: MicroPython imports a module's .py in preference to its .mpy."""
+        stale = []
+        for file in manifest['files']:
+            if file.endswith('.mpy'):
+                twin = file[:-4] + '.py'
+            elif file.endswith('.py'):
+                twin = file[:-3] + '.mpy'
+            else:
+                continue
+            try:
+                uos.stat(self._main_dir + '/' + twin)
+                stale.append(twin)
+            except OSError:
+                pass
+        return stale
+
+    def _commit_stage(self, version, manifest, files):
+        """Stages main.json for `version` and marks the stage complete."""
+        self._set_status('installing', 'Staging version file...', file=None)
         try:
-            with open(self._main_dir + '/main.json', 'w') as f:
-                ujson.dump({'version': version, 'files': files}, f)
+            manifest['version'] = version
+            # the stage directory does not exist yet if no file changed
+            self._makedirs(self._stage.stage_path('main.json'))
+            with open(self._stage.stage_path('main.json'), 'w') as f:
+                ujson.dump(manifest, f)
+            # main.json goes last: the version only changes once every file is in place
+            self._stage.commit(version, files + ['main.json'], self._stale_files(manifest))
             return True
         except OSError:
-            print("Failed to write new version file.")
+            self._error("Failed to stage new version file.")
             return False
 
-    def download_and_install_update_if_available(self):
+    async def download_and_install_update_if_available(self):
         """
         Checks for a new version and installs it if available.
         Returns a tuple of (bool, str) indicating success and a message.
+        The caller reboots after a successful update.
         """
-        latest_version, msg = self._get_latest_version()
+        latest_version, msg = await self._get_latest_version()
         if latest_version is None:
             return False, f"Could not get latest version: {msg}"
 
         print(f'Latest version is: {latest_version}')
+        self.status['latest_version'] = latest_version
 
         if latest_version > self.current_version:
             print(f'Newer version available. Updating from {self.current_version} to {latest_version}')
 
+            if self._bundle_url:
+                if await self._install_bundle(latest_version):
+                    print('Update staged. Rebooting to apply...')
+                    return True, 'Update staged. Rebooting to apply...'
+                self._error(f"{BUNDLE_NAME} failed, downloading files one by one")
+
             url = self._raw_url(latest_version, 'main.json')
-            manifest_data, msg = self._request_json(url)
+            manifest_data, msg = await self._request_json(url)
 
             if manifest_data is None:
                 return False, f"Could not fetch update manifest: {msg}"
             if 'files' not in manifest_data:
                 return False, "Malformed update manifest: 'files' list missing"
+            if self._mpy and (manifest_data.get('mpy') or {}).get('version') == self._mpy:
+                manifest_data = mpy_manifest(manifest_data)
 
-            if self._download_and_install(latest_version, manifest_data['files']):
-                print('Update successful. Rebooting...')
-                machine.reset()
-                return True, 'Update successful.'
+            if await self._download_and_install(latest_version, manifest_data):
+                print('Update staged. Rebooting to apply...')
+                return True, 'Update staged. Rebooting to apply...'
             else:
                 return False, 'Update failed during file download.'
         else:
             print('Current version is up to date.')
-            return False, 'No new update available.'
\ No newline at end of file
+            self._set_status('up_to_date', 'No new update available.')
+            return False, 'No new update available.'
@@ -0,0 +1,107 @@
+# lib/ota_bundle.py - Single-file OTA release bundle and .mpy manifests
+#
+# Shared by the device (reader) and tools/make_bundle.py (writer); it
+# runs unchanged on MicroPython and CPython.
+#
+# Layout:
+#   b'NPBO' | header length (4 bytes, big endian) | header | body
+# The header is the release's main.json (UTF-8 JSON) including its
+# "sha256" and "size" maps. The body is one zlib stream holding the
+# contents of header["files"], concatenated in that order.
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+MAGIC = b'NPBO'
+NAME = 'ota.bundle'
+MPY_DIR = 'mpy'
+
+try:
+    import deflate as _deflate
+    import io as _io
+
+    def _compress(data):
+        buf = _io.BytesIO()
+        with _deflate.DeflateIO(buf, _deflate.ZLIB) as d:
+            d.write(data)
+        return buf.getvalue()
+
+    def _inflater(stream):
+        return _deflate.DeflateIO(stream, _deflate.ZLIB)
+except ImportError:
+    import zlib as _zlib
+
+    def _compress(data):
+        return _zlib.compress(data, 9)
+
+    def _inflater(stream):
+        # MicroPython before 1.21; the reader is only used on the device
+        return _zlib.DecompIO(stream, 15)
+
+
+def bundle_name(mpy_version=None):
+    """Release asset name of the bundle, or of its .mpy variant."""
+    return f'ota-mpy{mpy_version}.bundle' if mpy_version else NAME
+
+
+def mpy_manifest(manifest):
+    """
+    Returns the manifest with every module that tools/build_mpy.py
+    compiled replaced by its .mpy file, or None if the release has no
+    .mpy build. The .mpy files install next to their sources; "remote"
+    maps them to where they live in the release (under mpy/).
+    """
+    mpy = manifest.get('mpy')
+    if not mpy:
+        return None
+    compiled = mpy['files']
+    files = []
+    remote = {}
+    for path in manifest['files']:
+        if path in compiled:
+            path = path[:-3] + '.mpy'
+            remote[path] = MPY_DIR + '/' + path
+        files.append(path)
+    result = {'version': manifest['version'], 'files': files, 'remote': remote}
+    for key in ('sha256', 'size'):
+        if key in manifest:
+            merged = {p: v for p, v in manifest[key].items() if p not in compiled}
+            merged.update(mpy.get(key) or {})
+            result[key] = merged
+    return result
+
+
+def pack(manifest, read_file):
+    """Returns the bundle for `manifest`; read_file(path) returns a file's
+    contents as bytes, given its release path."""
+    remote = manifest.get('remote') or {}
+    header = json.dumps(manifest).encode()
+    body = _compress(b''.join(read_file(remote.get(path, path))
+                              for path in manifest['files']))
+    return MAGIC + struct.pack('>I', len(header)) + header + body
+
+
+class BundleReader:
+    """
+    Reads a bundle from a binary file object. `manifest` is its header;
+    read(n) then returns the decompressed contents of manifest["files"]
+    back to back, so a caller takes manifest["size"][file] bytes per file
+    in order. Only the inflater's window is held in memory.
+    """
+
+    def __init__(self, stream):
+        if stream.read(4) != MAGIC:
+            raise ValueError("Not an OTA bundle")
+        size = struct.unpack('>I', stream.read(4))[0]
+        self.manifest = json.loads(stream.read(size))
+        if 'files' not in self.manifest or 'size' not in self.manifest:
+            raise ValueError("Malformed bundle header")
+        self._inflater = _inflater(stream)
+
+    def read(self, n):
+        return self._inflater.read(n)
@@ -0,0 +1,235 @@
+# lib/ota_stage.py - Staged OTA installs with boot-time apply and rollback
+#
+# Layout under <root>/.ota:
+#   stage/          downloaded, verified files of the next version
+#   pending.json    written last by the downloader; its presence means
+#                   the staged files are complete
+#   backup/         files replaced by the last applied update
+#   trial.json      the applied update has not passed a health check yet
+import uos
+import ujson
+import machine
+
+
+def _exists(path):
+    try:
+        uos.stat(path)
+        return True
+    except OSError:
+        return False
+
+
+def _makedirs(path):
+    """Creates the parent directories of `path`."""
+    parts = path.split('/')[:-1]
+    for i in range(1, len(parts) + 1):
+        if not parts[i - 1]:
+            continue  # leading '/'
+        try:
+            uos.mkdir('/'.join(parts[:i]))
+        except OSError as e:
+            if e.args[0] != 17:  # EEXIST
+                raise
+
+
+def _rmtree(path):
+    try:
+        names = uos.listdir(path)
+    except OSError:
+        return
+    for name in names:
+        child = path + '/' + name
+        if uos.stat(child)[0] & 0x4000:
+            _rmtree(child)
+        else:
+            uos.remove(child)
+    uos.rmdir(path)
+
+
+def _move(src, dst):
+    """Renames src over dst, which FAT only allows once dst is gone."""
+    _makedirs(dst)
+    try:
+        uos.rename(src, dst)
+    except OSError:
+        uos.remove(dst)
+        uos.rename(src, dst)
+
+
+def _write_json(path, data):
+    """Writes JSON through a temporary file, so readers never see half a file."""
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        ujson.dump(data, f)
+    _move(tmp, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r') as f:
+            return ujson.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class OTAStage:
+    """
+    Keeps a half-downloaded or half-applied update from ever leaving the
+    device with a mix of old and new files.
+
+    The updater downloads into stage_path() and calls commit(). boot.py
+    calls boot() on the next start, which moves the staged files into
+    place (keeping the replaced ones as backups) and marks the update as
+    on trial. Applying is resumable: if power is lost halfway, the next
+    boot finishes the job. main.py calls mark_healthy() once it has run
+    long enough; if it crashes first, the device resets (watchdog or
+    power cycle) and after `max_trial_boots` unhealthy boots the backups
+    are restored.
+    """
+
+    def __init__(self, root='.', max_trial_boots=3, watchdog_ms=180000):
+        self.root = root
+        self.dir = root + '/.ota'
+        self.stage_dir = self.dir + '/stage'
+        self.backup_dir = self.dir + '/backup'
+        self.pending_file = self.dir + '/pending.json'
+        self.trial_file = self.dir + '/trial.json'
+        self.max_trial_boots = max_trial_boots
+        self.watchdog_ms = watchdog_ms
+        self._wdt = None
+
+    # --- Downloader side ---
+
+    def stage_path(self, file):
+        return self.stage_dir + '/' + file
+
+    def reset(self):
+        """Discards a previous, unfinished or not yet applied staging."""
+        if _exists(self.pending_file):
+            uos.remove(self.pending_file)
+        _rmtree(self.stage_dir)
+
+    def commit(self, version, files, remove=()):
+        """Marks the staged `files` as complete; they are applied on the
+        next boot, and the live files in `remove` are deleted."""
+        _write_json(self.pending_file, {'version': version, 'files': files,
+                                        'remove': list(remove)})
+
+    @property
+    def pending(self):
+        return _exists(self.pending_file)
+
+    # --- Boot side ---
+
+    def boot(self):
+        """
+        Called early in boot.py. Applies a pending update or rolls back
+        one that keeps failing its trial, and arms the watchdog while an
+        update is on trial. Returns a short description of what it did.
+        """
+        if self.pending:
+            version = self.apply()
+            result = f'applied {version}'
+        else:
+            result = None
+        trial = _read_json(self.trial_file)
+        if trial is None:
+            return result or 'no update'
+        trial['boots'] = trial.get('boots', 0) + 1
+        if trial['boots'] > self.max_trial_boots:
+            self.rollback()
+            return f"rolled back {trial.get('version')} after {trial['boots'] - 1} failed boots"
+        _write_json(self.trial_file, trial)
+        self.start_watchdog()
+        return result or f"trial boot {trial['boots']} of {trial.get('version')}"
+
+    def apply(self):
+        """Moves the staged files into place. Safe to call again after an
+        interruption."""
+        pending = _read_json(self.pending_file)
+        if pending is None:
+            self.reset()
+            return None
+        remove = pending.get('remove') or []
+        if not _exists(self.trial_file):
+            # first attempt: backups from the previous update are obsolete
+            _rmtree(self.backup_dir)
+            _write_json(self.trial_file, {
+                'version': pending['version'], 'files': pending['files'] + remove,
+                'boots': 0, 'new': []})
+        trial = _read_json(self.trial_file)
+        for file in pending['files']:
+            staged = self.stage_path(file)
+            if not _exists(staged):
+                continue  # already applied
+            live = self.root + '/' + file
+            backup = self.backup_dir + '/' + file
+            if _exists(backup):
+                pass  # interrupted between backing up and moving in
+            elif _exists(live):
+                _move(live, backup)
+            elif file not in trial['new']:
+                trial['new'].append(file)
+                _write_json(self.trial_file, trial)
+            _move(staged, live)
+        for file in remove:
+            live = self.root + '/' + file
+            backup = self.backup_dir + '/' + file
+            if _exists(live) and not _exists(backup):
+                _move(live, backup)
+        uos.remove(self.pending_file)
+        _rmtree(self.stage_dir)
+        print(f"OTA: applied version {pending['version']}")
+        return pending['version']
+
+    def rollback(self):
+        """Restores the files replaced by the update on trial."""
+        trial = _read_json(self.trial_file)
+        if trial is None:
+            return False
+        for file in trial['files']:
+            backup = self.backup_dir + '/' + file
+            live = self.root + '/' + file
+            if _exists(backup):
+                _move(backup, live)
+            elif file in trial.get('new', ()) and _exists(live):
+                uos.remove(live)
+        uos.remove(self.trial_file)
+        _rmtree(self.backup_dir)
+        # the updater's cached hashes describe the files just rolled back
+        if _exists(self.root + '/.ota_index.json'):
+            uos.remove(self.root + '/.ota_index.json')
+        print(f"OTA: rolled back version {trial.get('version')}")
+        return True
+
+    @property
+    def on_trial(self):
+        return _exists(self.trial_file)
+
+    def mark_healthy(self):
+        """Confirms the running update; its backups are dropped."""
+        if not self.on_trial:
+            return False
+        uos.remove(self.trial_file)
+        _rmtree(self.backup_dir)
+        return True
+
+    # --- Watchdog ---
+
+    def start_watchdog(self):
+        """Arms the hardware watchdog, so a crash to the REPL during a
+        trial boot still ends in a reset. It cannot be stopped again;
+        main.py keeps calling feed()."""
+        if self.watchdog_ms:
+            self._wdt = machine.WDT(timeout=self.watchdog_ms)
+
+    def feed(self):
+        if self._wdt is not None:
+            self._wdt.feed()
+
+    @property
+    def watchdog_armed(self):
+        return self._wdt is not None
+
+
+stage = OTAStage()
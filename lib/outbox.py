@@ -0,0 +1,253 @@
+# lib/outbox.py - Store-and-forward queue for remote data posting
+import ujson
+import uos
+import random
+import uasyncio as asyncio
+
+from lib.log import log
+
+
+class Outbox:
+    """
+    A bounded in-memory queue drained by an async task. While the remote
+    host is unreachable, samples are spilled to a flash journal so they
+    survive a reboot, and are sent in batches once the host recovers.
+    Samples are always delivered oldest first: everything in the journal
+    is older than anything still in the RAM queue. When the journal is
+    full, the oldest samples are dropped, so a long outage loses its
+    beginning rather than the latest readings.
+    """
+
+    def __init__(self, sender, queue_size=10, batch_size=1,
+                 journal='outbox.jsonl', journal_max=500,
+                 backoff_min=5, backoff_max=600):
+        self._send = sender
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.journal_max = journal_max
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self._journal = journal
+        self._pos_file = journal + '.pos'
+        self._tmp_file = journal + '.tmp'
+        self._queue = []
+        self._event = asyncio.Event()
+        self._failures = 0
+        self.sent = 0
+        self.dropped = 0
+        self.errors = 0
+        self._journal_pos = 0
+        self._skip = 0      # oldest journaled samples dropped, not yet read past
+        self._inflight = 0  # journaled samples in the batch being sent
+        self._journal_count = self._count_journal()
+
+    def _count_journal(self):
+        """Counts the unsent records left in the journal from a previous run."""
+        try:
+            uos.stat(self._journal)
+        except OSError:
+            # power lost while compacting, after the old journal was removed
+            try:
+                uos.rename(self._tmp_file, self._journal)
+            except OSError:
+                pass
+        try:
+            with open(self._pos_file, 'r') as f:
+                self._journal_pos = int(f.read())
+        except (OSError, ValueError):
+            self._journal_pos = 0
+        count = 0
+        try:
+            with open(self._journal, 'r') as f:
+                f.seek(self._journal_pos)
+                while f.readline():
+                    count += 1
+        except OSError:
+            pass
+        if count:
+            log(f"Outbox: {count} journaled samples pending from previous run.")
+        return count
+
+    def put(self, sample):
+        """Queues a sample. Never blocks; spills to flash when needed."""
+        if self._failures or self._journal_count or len(self._queue) >= self.queue_size:
+            # Host is down or we are backed up: keep ordering by moving the
+            # RAM queue into the journal ahead of the new sample.
+            self._queue.append(sample)
+            self._spill()
+        else:
+            self._queue.append(sample)
+        self._event.set()
+
+    def _spill(self):
+        """Appends the RAM queue to the journal. If it doesn't fit, the
+        oldest samples are dropped: first from the head of the journal
+        (except a batch being sent), then from the front of the queue."""
+        live = self._journal_count - self._skip
+        over = live + len(self._queue) - self.journal_max
+        if over > 0:
+            trim = min(over, live - self._inflight)
+            self._skip += trim
+            self._queue = self._queue[over - trim:]
+            self.dropped += over
+            if not self._inflight:
+                try:
+                    self._drop_skipped()
+                except OSError as e:
+                    log(f"Outbox: journal trim failed: {e}")
+        if not self._queue:
+            return
+        try:
+            with open(self._journal, 'a') as f:
+                for sample in self._queue:
+                    f.write(ujson.dumps(sample))
+                    f.write('\n')
+            self._journal_count += len(self._queue)
+        except OSError as e:
+            log(f"Outbox: journal write failed: {e}")
+            self.dropped += len(self._queue)
+        self._queue = []
+
+    def _drop_skipped(self):
+        """Moves the journal head past the samples _spill() dropped, and
+        compacts the file once most of it has been read past."""
+        if not self._skip:
+            return
+        with open(self._journal, 'r') as f:
+            f.seek(self._journal_pos)
+            for _ in range(self._skip):
+                if not f.readline():
+                    break
+            pos = f.tell()
+        count, self._skip = self._skip, 0
+        self._advance_journal(pos, count)
+        if self._journal_count and self._journal_pos * 2 > uos.stat(self._journal)[6]:
+            self._compact()
+
+    def _compact(self):
+        """Rewrites the journal without the records already read past, so a
+        long outage that keeps dropping the oldest samples does not grow
+        the file without bound."""
+        with open(self._journal, 'r') as src, open(self._tmp_file, 'w') as dst:
+            src.seek(self._journal_pos)
+            while True:
+                line = src.readline()
+                if not line:
+                    break
+                dst.write(line)
+        # Without the position file a power loss replays the old journal
+        # from the start (duplicates) instead of skipping live records.
+        try:
+            uos.remove(self._pos_file)
+        except OSError:
+            pass
+        uos.remove(self._journal)
+        uos.rename(self._tmp_file, self._journal)
+        self._journal_pos = 0
+
+    def _read_journal_batch(self):
+        """Returns (samples, lines_read, next_offset) for the oldest batch."""
+        batch = []
+        lines = 0
+        with open(self._journal, 'r') as f:
+            f.seek(self._journal_pos)
+            while lines < self.batch_size:
+                line = f.readline()
+                if not line:
+                    break
+                lines += 1
+                try:
+                    batch.append(ujson.loads(line))
+                except ValueError:
+                    self.dropped += 1
+            return batch, lines, f.tell()
+
+    def _advance_journal(self, pos, count):
+        self._journal_count -= count
+        if self._journal_count <= 0:
+            self._journal_count = 0
+            self._journal_pos = 0
+            self._skip = 0
+            for path in (self._journal, self._pos_file):
+                try:
+                    uos.remove(path)
+                except OSError:
+                    pass
+            return
+        self._journal_pos = pos
+        try:
+            with open(self._pos_file, 'w') as f:
+                f.write(str(pos))
+        except OSError:
+            pass
+
+    def _backoff(self):
+        """Exponential backoff with +/-50% jitter, in seconds."""
+        delay = min(self.backoff_max, self.backoff_min * (1 << min(self._failures - 1, 16)))
+        return delay * (0.5 + random.getrandbits(8) / 256)
+
+    def stats(self):
+        """Returns the queue depth and delivery counters."""
+        return {
+            'queued': len(self._queue),
+            'journaled': self._journal_count - self._skip,
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'failures': self._failures,
+        }
+
+    async def run(self):
+        """Drains the queue forever. Start it with asyncio.create_task()."""
+        while True:
+            if not self._queue and not self._journal_count:
+                self._event.clear()
+                await self._event.wait()
+
+            from_journal = self._journal_count > 0
+            try:
+                if from_journal:
+                    self._drop_skipped()
+                    if not self._journal_count:
+                        continue  # everything left had been dropped
+                    batch, lines, next_pos = self._read_journal_batch()
+                else:
+                    batch = self._queue[:self.batch_size]
+                    self._queue = self._queue[len(batch):]
+            except OSError as e:
+                log(f"Outbox: journal read failed: {e}")
+                self.dropped += self._journal_count
+                self._advance_journal(0, self._journal_count)
+                continue
+
+            ok = False
+            if batch:
+                # the samples being sent must not be trimmed meanwhile
+                self._inflight = lines if from_journal else 0
+                try:
+                    ok = await self._send(batch)
+                except Exception as e:
+                    # a timeout has no message, so name the exception
+                    log(f"Host unreachable or request failed: {type(e).__name__} {e}")
+                self._inflight = 0
+            else:
+                ok = True  # only unreadable lines were left
+
+            if ok:
+                self.sent += len(batch)
+                self._failures = 0
+                if from_journal:
+                    self._advance_journal(next_pos, lines if lines else self._journal_count)
+                await asyncio.sleep_ms(0)
+            else:
+                self.errors += 1
+                self._failures += 1
+                if not from_journal:
+                    # Samples queued while this batch was in flight stay
+                    # behind it.
+                    self._queue = batch + self._queue
+                self._spill()
+                delay = self._backoff()
+                log(f"Outbox: send failed ({self._failures}x), "
+                    f"{self._journal_count - self._skip} journaled, retrying in {int(delay)}s")
+                await asyncio.sleep(delay)
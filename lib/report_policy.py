@@ -0,0 +1,90 @@
+# lib/report_policy.py - Deadband / change-only filter for outbound telemetry
+import time
+
+
+class ReportPolicy:
+    """
+    Decides which fields of a sample are worth sending to a sink.
+
+    `rules` maps a field name to a dict with any of:
+        'abs': absolute deadband (send when |new - last| > abs)
+        'rel': relative deadband (send when |new - last| > rel * |last|)
+        'min': minimum seconds between two reports of the field
+        'max': maximum seconds without a report (heartbeat)
+    Fields without a rule use `default`. Without a deadband a field is
+    reported on any change. Non-numeric fields are compared for equality.
+
+    `always` fields (e.g. a timestamp) never trigger a report on their own
+    but are attached to every non-empty one. Every `keyframe_interval`
+    seconds the whole sample is reported.
+
+    Each sink keeps its own instance, since the state tracks what that
+    sink has already been sent.
+    """
+
+    def __init__(self, rules=None, default=None, always=(), keyframe_interval=600):
+        self.rules = rules or {}
+        self.default = default or {}
+        self.always = always
+        self.keyframe_interval = keyframe_interval
+        self._last = {}
+        self._last_keyframe = None
+        self.suppressed = 0
+
+    def force_keyframe(self):
+        """Makes the next call to filter() return the full sample."""
+        self._last_keyframe = None
+
+    def _crossed(self, rule, new, old):
+        if isinstance(new, bool) or not isinstance(new, (int, float)) \
+                or not isinstance(old, (int, float)):
+            return new != old
+        delta = abs(new - old)
+        if 'abs' not in rule and 'rel' not in rule:
+            return delta != 0
+        if 'abs' in rule and delta > rule['abs']:
+            return True
+        if 'rel' in rule and delta > rule['rel'] * abs(old):
+            return True
+        return False
+
+    def filter(self, data, now=None):
+        """
+        Returns (fields, keyframe): the subset of `data` to send and whether
+        it is a full keyframe. `fields` is empty when nothing needs sending,
+        and is always a new dict the caller may modify.
+        """
+        if now is None:
+            now = time.time()
+        if self._last_keyframe is None or now - self._last_keyframe >= self.keyframe_interval:
+            self._last_keyframe = now
+            for key, value in data.items():
+                self._last[key] = (value, now)
+            return dict(data), True
+
+        out = {}
+        for key, value in data.items():
+            if key in self.always:
+                continue
+            last = self._last.get(key)
+            if last is None:
+                send = True
+            else:
+                rule = self.rules.get(key, self.default)
+                age = now - last[1]
+                if rule.get('max') and age >= rule['max']:
+                    send = True
+                elif rule.get('min') and age < rule['min']:
+                    send = False
+                else:
+                    send = self._crossed(rule, value, last[0])
+            if send:
+                out[key] = value
+                self._last[key] = (value, now)
+            else:
+                self.suppressed += 1
+        if out:
+            for key in self.always:
+                if key in data:
+                    out[key] = data[key]
+        return out, False
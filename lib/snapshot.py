@@ -0,0 +1,135 @@
+# lib/snapshot.py - Pre-serialized /api/data document with version ETags
+import ujson
+import random
+import time
+import uasyncio as asyncio
+
+
+def merge_patch(old, new):
+    """Returns a JSON merge patch (RFC 7386) turning `old` into `new`."""
+    patch = {}
+    for key, value in new.items():
+        prev = old.get(key, merge_patch)  # sentinel: key is new
+        if prev == value:
+            continue
+        if isinstance(value, dict) and isinstance(prev, dict):
+            patch[key] = merge_patch(prev, value)
+        else:
+            patch[key] = value
+    for key in old:
+        if key not in new:
+            patch[key] = None
+    return patch
+
+
+def _fold(acc, patch):
+    """Merges `patch` into the accumulated patch `acc` (copying dicts)."""
+    for key, value in patch.items():
+        if isinstance(value, dict):
+            prev = acc.get(key)
+            acc[key] = _fold(prev if isinstance(prev, dict) else {}, value)
+        else:
+            acc[key] = value
+    return acc
+
+
+class Snapshot:
+    """
+    Holds the /api/data document serialized once per change.
+
+    The data part (burner, sensors, last_update) is serialized when the
+    collector publishes it. The volatile device part is produced by
+    `esp32_fn` and cached for `esp32_ttl_ms`, so concurrent dashboards
+    share both. Every distinct body gets a version-based ETag.
+    Streaming endpoints await wait() to be woken on each publish().
+
+    The last `changelog_size` data changes are kept as merge patches so
+    that clients can fetch only what changed since a version they hold.
+    Versions start at a random base on each boot, so a version from
+    before a reboot never matches the new change log.
+    """
+
+    def __init__(self, esp32_fn, esp32_ttl_ms=5000, changelog_size=16):
+        self._esp32_fn = esp32_fn
+        self.esp32_ttl_ms = esp32_ttl_ms
+        self.changelog_size = changelog_size
+        self._changelog = []
+        self.version = random.getrandbits(20) << 10
+        self.data = {}
+        self._data_json = b'{}'
+        self._esp32_gen = 0
+        self._esp32_at = None
+        self._esp32 = None
+        self._esp32_json = b'null'
+        self._body = None
+        self._body_key = None
+        self._changed = asyncio.Event()
+
+    def publish(self, data):
+        """Replaces the data part. `data` must not be mutated afterwards;
+        a 'version' key is added to it."""
+        self.version += 1
+        data['version'] = self.version
+        self._changelog.append((self.version, merge_patch(self.data, data)))
+        if len(self._changelog) > self.changelog_size:
+            self._changelog.pop(0)
+        self.data = data
+        self._data_json = ujson.dumps(data).encode()
+        # Wake every current waiter; later waiters get a fresh event.
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait(self, timeout):
+        """Waits up to `timeout` seconds for the next publish()."""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _refresh_esp32(self):
+        now = time.ticks_ms()
+        if self._esp32_at is None or time.ticks_diff(now, self._esp32_at) >= self.esp32_ttl_ms:
+            self._esp32 = self._esp32_fn()
+            self._esp32_json = ujson.dumps(self._esp32).encode()
+            self._esp32_at = now
+            self._esp32_gen += 1
+
+    def etag(self):
+        self._refresh_esp32()
+        return f'"{self.version}-{self._esp32_gen}"'
+
+    def document(self):
+        """Returns the full document as a new dict (shallow copy)."""
+        self._refresh_esp32()
+        doc = dict(self.data)
+        doc['esp32'] = self._esp32
+        return doc
+
+    def delta_since(self, version):
+        """
+        Returns a merge patch of the data part from `version` to the current
+        one, or None if `version` is unknown or has left the change log and
+        the client must resync from the full document.
+        """
+        if version == self.version:
+            return {}
+        if not self._changelog or not \
+                self._changelog[0][0] - 1 <= version < self.version:
+            return None
+        patch = {}
+        for v, change in self._changelog:
+            if v > version:
+                _fold(patch, change)
+        return patch
+
+    def body(self):
+        """Returns (body_bytes, etag) for the full document."""
+        etag = self.etag()
+        if self._body_key != etag:
+            # Splice the cached esp32 JSON into the cached data JSON
+            # rather than serializing the whole document again.
+            data = self._data_json[:-1]
+            sep = b', ' if len(data) > 1 else b''
+            self._body = data + sep + b'"esp32": ' + self._esp32_json + b'}'
+            self._body_key = etag
+        return self._body, etag
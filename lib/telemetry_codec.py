@@ -0,0 +1,188 @@
+# lib/telemetry_codec.py - Compact binary encoding for remote telemetry batches
+#
+# Shared by the device (encoder) and the receiving server (decoder); it
+# runs unchanged on MicroPython and CPython.
+#
+# Frame layout:
+#   b'NPT' | schema version (1 byte) | flags (1 byte) | body
+# Body (deflate/zlib-compressed when flags & FLAG_DEFLATE):
+#   record count (varint), then per record:
+#   field count (varint), then per field: key, value
+# Keys are varint indexes into KEYS[schema] (1-based); 0 is followed by
+# the key as an inline string, so new fields never break the format.
+# Values start with a one-byte type tag, see the _T_* constants.
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+
+MAGIC = b'NPT'
+SCHEMA_VERSION = 1
+FLAG_DEFLATE = 0x01
+CONTENT_TYPE = 'application/x-npbc-telemetry'
+
+# The key dictionary is fixed per schema version: bump SCHEMA_VERSION and
+# add a new tuple instead of editing an existing one.
+KEYS = {
+    1: (
+        'SwVer', 'Date', 'Mode', 'State', 'Status', 'IgnitionFail',
+        'PelletJam', 'Tset', 'Tboiler', 'DHW', 'Flame', 'Heater', 'DHWPump',
+        'CHPump', 'BF', 'FF', 'Fan', 'Power', 'ThermostatStop', 'FFWorkTime',
+        'BME_TYPE', 'TBMP', 'PBMP', 'HUM', 'TDS18', 'KTYPE', 'keyframe',
+    ),
+}
+
+_T_NONE = 0
+_T_FALSE = 1
+_T_TRUE = 2
+_T_INT = 3      # zigzag varint
+_T_CENTI = 4    # value * 100 as zigzag varint (floats with <= 2 decimals)
+_T_FLOAT = 5    # float32, little endian
+_T_STR = 6      # varint length + UTF-8
+
+try:
+    import deflate as _deflate
+    import io as _io
+
+    def _compress(data):
+        buf = _io.BytesIO()
+        with _deflate.DeflateIO(buf, _deflate.ZLIB) as d:
+            d.write(data)
+        return buf.getvalue()
+
+    def _decompress(data):
+        return _deflate.DeflateIO(_io.BytesIO(data), _deflate.ZLIB).read()
+except ImportError:
+    import zlib as _zlib
+
+    def _compress(data):
+        return _zlib.compress(data)
+
+    def _decompress(data):
+        return _zlib.decompress(data)
+
+
+def _put_varint(out, n):
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _get_varint(data, pos):
+    n = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return n, pos
+        shift += 7
+
+
+def _put_str(out, s):
+    b = s.encode()
+    _put_varint(out, len(b))
+    out.extend(b)
+
+
+def _put_value(out, value):
+    if value is None:
+        out.append(_T_NONE)
+    elif value is True:
+        out.append(_T_TRUE)
+    elif value is False:
+        out.append(_T_FALSE)
+    elif isinstance(value, int):
+        out.append(_T_INT)
+        _put_varint(out, (value << 1) if value >= 0 else ((-value << 1) - 1))
+    elif isinstance(value, float):
+        centi = round(value * 100) if abs(value) < 1e12 else 0
+        if abs(value) < 1e12 and abs(value * 100 - centi) < 1e-6:
+            out.append(_T_CENTI)
+            _put_varint(out, (centi << 1) if centi >= 0 else ((-centi << 1) - 1))
+        else:
+            out.append(_T_FLOAT)
+            out.extend(struct.pack('<f', value))
+    else:
+        out.append(_T_STR)
+        _put_str(out, str(value))
+
+
+def encode(records, compress=False, schema=SCHEMA_VERSION):
+    """Encodes a list of flat dicts into a telemetry frame (bytes)."""
+    index = {key: i + 1 for i, key in enumerate(KEYS[schema])}
+    body = bytearray()
+    _put_varint(body, len(records))
+    for record in records:
+        _put_varint(body, len(record))
+        for key, value in record.items():
+            i = index.get(key)
+            if i:
+                _put_varint(body, i)
+            else:
+                body.append(0)
+                _put_str(body, key)
+            _put_value(body, value)
+    flags = 0
+    if compress:
+        body = _compress(body)
+        flags |= FLAG_DEFLATE
+    return MAGIC + bytes([schema, flags]) + body
+
+
+def _unzigzag(n):
+    return (n >> 1) if not n & 1 else -((n + 1) >> 1)
+
+
+def decode(frame):
+    """Decodes a telemetry frame back into a list of dicts."""
+    if frame[:3] != MAGIC:
+        raise ValueError('Not a telemetry frame')
+    schema, flags = frame[3], frame[4]
+    if schema not in KEYS:
+        raise ValueError(f'Unknown telemetry schema version {schema}')
+    keys = KEYS[schema]
+    data = frame[5:]
+    if flags & FLAG_DEFLATE:
+        data = _decompress(data)
+    count, pos = _get_varint(data, 0)
+    records = []
+    for _ in range(count):
+        nfields, pos = _get_varint(data, pos)
+        record = {}
+        for _ in range(nfields):
+            k, pos = _get_varint(data, pos)
+            if k:
+                key = keys[k - 1]
+            else:
+                n, pos = _get_varint(data, pos)
+                key = bytes(data[pos:pos + n]).decode()
+                pos += n
+            tag = data[pos]
+            pos += 1
+            if tag == _T_NONE:
+                value = None
+            elif tag == _T_FALSE:
+                value = False
+            elif tag == _T_TRUE:
+                value = True
+            elif tag == _T_INT:
+                n, pos = _get_varint(data, pos)
+                value = _unzigzag(n)
+            elif tag == _T_CENTI:
+                n, pos = _get_varint(data, pos)
+                value = _unzigzag(n) / 100
+            elif tag == _T_FLOAT:
+                value = struct.unpack('<f', bytes(data[pos:pos + 4]))[0]
+                pos += 4
+            elif tag == _T_STR:
+                n, pos = _get_varint(data, pos)
+                value = bytes(data[pos:pos + n]).decode()
+                pos += n
+            else:
+                raise ValueError(f'Unknown value tag {tag}')
+            record[key] = value
+        records.append(record)
+    return records
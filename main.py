@@ -2,7 +2,6 @@
 import gc
 import json
 import uasyncio as asyncio
-import urequests as requests
 from machine import Pin, SPI, reset
 import network
 import time
@@ -11,12 +10,23 @@ import math
 
 # Web framework
 from microdot import Microdot, Response, send_file
+from microdot.websocket import with_websocket
 
 # App-specific imports
 from lib.config_loader import config
 from lib.npbc import NPBCController
-from lib.ota import OTAUpdater
+from lib.ota import OTAUpdater, MirrorSource
+from lib.ota_stage import stage as ota_stage
 from lib.scheduler import Scheduler
+from lib.outbox import Outbox
+from lib.http_client import HTTPClient
+from lib.mqtt import MQTTClient
+from lib.mqtt_publisher import MQTTPublisher
+from lib.report_policy import ReportPolicy
+from lib import telemetry_codec
+from lib.snapshot import Snapshot, merge_patch
+from lib import metrics
+from lib.jsonstream import JSONStream
 from drivers.max6675 import MAX6675
 from drivers.bme280_driver import BME280
 import onewire
@@ -46,11 +56,79 @@ app_state = {
 }
 
 # --- OTA Updater Instance ---
-ota_updater = OTAUpdater(config.GITHUB_REPO, main_dir='.')
+ota_source = MirrorSource(config.OTA_MIRROR_URL) if config.OTA_SOURCE == 'mirror' else None
+ota_updater = OTAUpdater(config.GITHUB_REPO, main_dir='.', stage=ota_stage, source=ota_source)
 
 # --- Scheduler Instance ---
 scheduler = Scheduler()
 
+# --- Outbound Reporting Policy ---
+def make_report_policy(keyframe_interval):
+    """Returns a fresh ReportPolicy; each sink tracks its own state."""
+    return ReportPolicy(
+        rules=config.REPORT_RULES,
+        default=config.REPORT_DEFAULT_RULE,
+        always=config.REPORT_ALWAYS_FIELDS,
+        keyframe_interval=keyframe_interval
+    )
+
+remote_policy = make_report_policy(config.REPORT_KEYFRAME_INTERVAL) \
+    if config.REMOTE_POST_CHANGES_ONLY else None
+
+# --- Remote Posting Outbox ---
+remote_client = HTTPClient(
+    timeout=config.REMOTE_POST_TIMEOUT,
+    idle_timeout=config.REMOTE_KEEPALIVE
+)
+
+async def post_samples(batch):
+    """Posts a batch of samples to REMOTE_POST_URL. Returns True on success."""
+    if config.REMOTE_POST_FORMAT == 'packed':
+        response = await remote_client.post(
+            config.REMOTE_POST_URL,
+            body=telemetry_codec.encode(batch, compress=config.REMOTE_POST_DEFLATE),
+            headers={'Content-Type': telemetry_codec.CONTENT_TYPE}
+        )
+    else:
+        payload = batch if config.REMOTE_POST_BATCH > 1 else batch[0]
+        response = await remote_client.post(config.REMOTE_POST_URL, json=payload)
+    try:
+        await response.content()
+        if response.status_code == 200:
+            log(f"Posted {len(batch)} sample(s) successfully.")
+            return True
+        log(f"Server responded with status {response.status_code}")
+        return False
+    finally:
+        await response.aclose()
+
+outbox = Outbox(
+    post_samples,
+    queue_size=config.OUTBOX_QUEUE_SIZE,
+    batch_size=config.REMOTE_POST_BATCH,
+    journal_max=config.OUTBOX_JOURNAL_MAX,
+    backoff_max=config.OUTBOX_BACKOFF_MAX
+)
+
+# --- MQTT Publisher ---
+mqtt_publisher = None
+if config.MQTT_BROKER:
+    import ubinascii
+    from machine import unique_id
+    mqtt_publisher = MQTTPublisher(
+        MQTTClient(
+            config.MQTT_CLIENT_ID or 'npbc-' + ubinascii.hexlify(unique_id()).decode(),
+            config.MQTT_BROKER,
+            port=config.MQTT_PORT,
+            user=config.MQTT_USER,
+            password=config.MQTT_PASSWORD,
+            keepalive=config.MQTT_KEEPALIVE
+        ),
+        prefix=config.MQTT_TOPIC_PREFIX,
+        policy=make_report_policy(config.MQTT_SNAPSHOT_INTERVAL),
+        command_handler=lambda mode, priority: apply_settings(npbc_controller, mode, priority)
+    )
+
 # --- Sensor Reading Classes ---
 class SensorReader:
     def __init__(self):
@@ -92,18 +170,18 @@ class SensorReader:
                     data['HUM'] = round(hum, 2)
             except Exception as e:
                 log(f"Error reading BME/BMP sensor: {e}")
-                data['TBMP'], data['PBMP'] = 0, 0
+                data['TBMP'], data['PBMP'] = 0.0, 0.0
         else:
             data['BME_TYPE'] = 'N/A'
-            data['TBMP'] = 0
-            data['PBMP'] = 0
+            data['TBMP'] = 0.0
+            data['PBMP'] = 0.0
 
         if self.ds_rom:
             self.ds_sensor.convert_temp()
             await asyncio.sleep_ms(750)
             data['TDS18'] = round(self.ds_sensor.read_temp(self.ds_rom), 2)
         else:
-            data['TDS18'] = 0
+            data['TDS18'] = 0.0
 
         k_type_temp = self.k_type.read()
         if k_type_temp is not None and math.isnan(k_type_temp):
@@ -143,6 +221,7 @@ async def data_collector_task(npbc, sensors):
             app_state['burner'] = burner_data if burner_data else {'status': 'Unavailable'}
             app_state['sensors'] = sensor_data
             app_state['last_update'] = f"{local_time_tuple[3]:02d}:{local_time_tuple[4]:02d}:{local_time_tuple[5]:02d}"
+            publish_snapshot()
 
             full_data = burner_data.copy()
             full_data.update(sensor_data)
@@ -150,22 +229,16 @@ async def data_collector_task(npbc, sensors):
             log(f"Data: {full_data}")
 
             if config.REMOTE_POST_URL and burner_data:
-                try:
-                    response = requests.post(
-                        config.REMOTE_POST_URL,
-                        json=full_data,
-                        headers={'content-type': 'application/json'}
-                    )
+                if remote_policy:
+                    fields, keyframe = remote_policy.filter(full_data)
+                    if fields:
+                        fields['keyframe'] = keyframe
+                        outbox.put(fields)
+                else:
+                    outbox.put(full_data)
 
-                    if response.status_code == 200:
-                        log("Data posted successfully.")
-                    else:
-                        log(f"Server responded with status {response.status_code}")
-
-                    response.close()
-
-                except Exception as e:
-                    log(f"Host unreachable or request failed: {e}")
+            if mqtt_publisher:
+                mqtt_publisher.update(full_data)
 
         except Exception as e:
             log(f"Error in data collection: {e}")
@@ -250,6 +323,19 @@ async def ntp_sync_task():
         except Exception as e:
             log(f"Periodic NTP sync failed: {e}")
 
+# --- OTA HEALTH TASK ---
+async def ota_health_task():
+    """Feeds the watchdog that boot.py arms for a freshly applied update,
+    and confirms the update once the application has run for
+    OTA_HEALTH_DELAY seconds. Until then a reset counts as a failed boot."""
+    elapsed = 0
+    while True:
+        ota_stage.feed()
+        if elapsed >= config.OTA_HEALTH_DELAY and ota_stage.mark_healthy():
+            log("OTA update confirmed healthy.")
+        await asyncio.sleep(5)
+        elapsed += 5
+
 # --- Helper Functions ---
 def get_wifi_rssi():
     try:
@@ -291,40 +377,283 @@ def format_burner_data(data):
     formatted['CHPump'] = "On" if data.get('CHPump') else "Off"
     return formatted
 
+def esp32_info():
+    """Volatile device fields for /api/data; cached by the snapshot TTL."""
+    return {
+        'uptime': format_uptime(time.time() - boot_time),
+        'version': _sw_version,
+        'update_available': ota_updater.update_available,
+        'latest_version': ota_updater.latest_version,
+        'rssi': get_wifi_rssi(),
+        'free_mem': gc.mem_free(),
+        'ip': network.WLAN(network.STA_IF).ifconfig()[0],
+        'outbox': outbox.stats(),
+        'mqtt': mqtt_publisher.stats() if mqtt_publisher else None,
+    }
+
+# --- /api/data Snapshot ---
+snapshot = Snapshot(esp32_info, esp32_ttl_ms=config.API_ESP32_TTL * 1000,
+                    changelog_size=config.API_CHANGELOG_SIZE)
+
+def publish_snapshot():
+    """Serializes app_state for /api/data. Call after every app_state change."""
+    snapshot.publish({
+        'burner': format_burner_data(app_state.get('burner', {})),
+        'sensors': app_state.get('sensors', {}),
+        'last_update': app_state.get('last_update'),
+    })
+
+publish_snapshot()
+
+async def apply_settings(npbc, mode, priority):
+    """Sets burner mode/priority and reads the new state back.
+    Returns the raw burner data dict, or None if either step failed."""
+    if not await npbc.set_mode_and_priority(mode, priority):
+        return None
+
+    await asyncio.sleep_ms(250)
+
+    new_burner_data_obj = await npbc.get_general_information()
+    if not new_burner_data_obj:
+        return None
+    new_burner_data_dict = new_burner_data_obj.to_dict()
+    app_state['burner'] = new_burner_data_dict
+    publish_snapshot()
+    return new_burner_data_dict
+
 # --- Web Server Setup ---
 app = Microdot()
+app.keep_alive_timeout = config.HTTP_KEEPALIVE_TIMEOUT
+app.max_keep_alive_requests = config.HTTP_MAX_REQUESTS
+app.max_connections = config.HTTP_MAX_CONNECTIONS
+app.max_request_rate = config.HTTP_RATE_LIMIT
+app.max_request_burst = config.HTTP_RATE_BURST
+app.min_free_memory = config.HTTP_MIN_FREE_MEMORY
+app.request_timeout = config.HTTP_REQUEST_TIMEOUT
 Response.default_content_type = 'text/html'
 npbc_controller = None
 
+# --- Boot Timing (compares .py and precompiled .mpy installs) ---
+first_response_logged = False
+
+@app.after_request
+async def log_first_response(request, response):
+    global first_response_logged
+    if not first_response_logged:
+        first_response_logged = True
+        log(f"First HTTP response {time.ticks_ms()} ms after reset, "
+            f"{gc.mem_free()} bytes free")
+
+# --- Pre-compressed Assets (built by tools/build_assets.py) ---
+assets = {}
+try:
+    with open('www/assets.json', 'r') as f:
+        assets = json.load(f)
+except Exception:
+    log("No www/assets.json; serving uncompressed dashboard files.")
+
+def send_asset(request, url, fallback):
+    """
+    Serves the gzipped build of `url` to clients that accept gzip, with
+    immutable caching for content-hashed names and ETag revalidation for
+    the rest. Other clients, or a missing build, get the source file.
+    """
+    asset = assets.get(url)
+    if asset is None:
+        return send_file(fallback)
+    if 'gzip' not in request.headers.get('Accept-Encoding', ''):
+        return send_file(asset['source'])
+    headers = {
+        'ETag': asset['etag'],
+        'Vary': 'Accept-Encoding',
+        'Cache-Control': 'public, max-age=31536000, immutable'
+        if asset.get('immutable') else 'no-cache',
+    }
+    if request.headers.get('If-None-Match') == asset['etag']:
+        return Response(b'', 304, headers)
+    res = send_file(asset['file'], compressed=True)
+    res.headers.update(headers)
+    return res
+
 @app.route('/')
 async def index(request):
-    return send_file('templates/index.html')
+    return send_asset(request, '/', 'templates/index.html')
 
 @app.route('/static/<path:path>')
 def static(request, path):
-    return send_file(f'static/{path}')
+    return send_asset(request, f'/static/{path}', f'static/{path}')
 
 @app.route('/api/data')
 async def api_data(request):
-    current_uptime_seconds = time.time() - boot_time
-
-    full_state = {
-        'burner': format_burner_data(app_state.get('burner', {})),
-        'sensors': app_state.get('sensors', {}),
-        'last_update': app_state.get('last_update'),
-        'esp32': {
-            'uptime': format_uptime(current_uptime_seconds),
-            'version': _sw_version,
-            'rssi': get_wifi_rssi(),
-            'free_mem': gc.mem_free(),
-            'ip': network.WLAN(network.STA_IF).ifconfig()[0],
-        }
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            patch = snapshot.delta_since(int(since))
+        except ValueError:
+            patch = None
+        if patch is None:
+            return Response({'version': snapshot.version, 'full': snapshot.document()})
+        # The device fields are small and TTL-cached; always include them.
+        patch['esp32'] = snapshot.document()['esp32']
+        return Response({'version': snapshot.version, 'patch': patch})
+
+    body, etag = snapshot.body()
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if request.headers.get('If-None-Match') == etag:
+        return Response(b'', 304, headers)
+    headers['Content-Type'] = 'application/json'
+    return Response(body, headers=headers)
+
+def _metric_sources():
+    """Returns (groups, stats) for the /metrics and /api/line renderers."""
+    groups = [
+        ('burner', app_state.get('burner')),
+        ('sensor', app_state.get('sensors')),
+        ('system', {
+            'uptime_seconds': time.time() - boot_time,
+            'heap_free_bytes': gc.mem_free(),
+            'heap_alloc_bytes': gc.mem_alloc(),
+            'wifi_rssi_dbm': get_wifi_rssi(),
+        }),
+    ]
+    stats = {
+        'report': {'suppressed': remote_policy.suppressed} if remote_policy else None,
+        'outbox': outbox.stats(),
+        'http': remote_client.stats(),
+        'mqtt': mqtt_publisher.stats() if mqtt_publisher else None,
+        'sse': {'clients': SnapshotStream.clients},
+        'ws': {'clients': LiveSocket.clients},
     }
-    return Response(json.dumps(full_state), headers={'Content-Type': 'application/json'})
+    return groups, stats
+
+@app.route('/metrics')
+async def api_metrics(request):
+    groups, stats = _metric_sources()
+    return Response(metrics.prometheus('npbc', groups, stats),
+                    headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+@app.route('/api/line')
+async def api_line(request):
+    groups, stats = _metric_sources()
+    return Response(metrics.influx('npbc', groups, stats, tags={'version': _sw_version},
+                                   float_groups=('sensor',)),
+                    headers={'Content-Type': 'text/plain; charset=utf-8'})
+
+class SnapshotStream:
+    """Async iterator body for /api/stream (Server-Sent Events).
+
+    Emits the full /api/data document as a `data` event whenever the
+    snapshot changes, and a comment line as a heartbeat otherwise.
+    MicroPython has no async generators, hence the explicit class."""
+    clients = 0
+
+    def __init__(self):
+        self._version = None
+        self._closed = True
+
+    def __aiter__(self):
+        # Counted from here rather than __init__: HEAD requests never iterate.
+        SnapshotStream.clients += 1
+        self._closed = False
+        return self
+
+    async def __anext__(self):
+        if self._closed:
+            raise StopAsyncIteration
+        if self._version == snapshot.version:
+            await snapshot.wait(config.SSE_HEARTBEAT)
+        if self._version == snapshot.version:
+            return b': ping\n\n'
+        self._version = snapshot.version
+        body, etag = snapshot.body()
+        return b'event: data\nid: ' + etag.encode() + b'\ndata: ' + body + b'\n\n'
+
+    async def aclose(self):
+        if not self._closed:
+            self._closed = True
+            SnapshotStream.clients -= 1
+
+@app.route('/api/stream')
+async def api_stream(request):
+    if SnapshotStream.clients >= config.SSE_MAX_CLIENTS:
+        return Response({'status': 'too many streams'}, 503, headers={'Retry-After': '30'})
+    return Response(SnapshotStream(), headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+    })
+
+class LiveSocket:
+    """One /api/ws client: pushes snapshot deltas and applies settings.
+
+    Server -> client messages:
+      {"type": "snapshot", "data": {...}}   full document, sent first
+      {"type": "delta", "patch": {...}}     JSON merge patch of the document
+      {"type": "ack", "ok": bool, "burner": {...}}  reply to "settings"
+    Client -> server messages:
+      {"type": "settings", "mode": 1, "priority": 0}"""
+    clients = 0
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.lock = asyncio.Lock()
+
+    async def send(self, msg):
+        # The sender task and the control handler share one socket.
+        async with self.lock:
+            await self.ws.send(json.dumps(msg))
+
+    async def push_updates(self):
+        last = None
+        while True:
+            doc = snapshot.document()
+            if last is None:
+                await self.send({'type': 'snapshot', 'data': doc})
+            else:
+                patch = merge_patch(last, doc)
+                if patch:
+                    await self.send({'type': 'delta', 'patch': patch})
+            last = doc
+            await snapshot.wait(config.SSE_HEARTBEAT)
+
+    async def handle(self, message):
+        try:
+            msg = json.loads(message)
+        except ValueError:
+            return
+        if msg.get('type') != 'settings':
+            return
+        burner = None
+        try:
+            burner = await apply_settings(npbc_controller, int(msg['mode']), int(msg['priority']))
+        except Exception as e:
+            log(f"Error applying settings over WebSocket: {e}")
+        await self.send({
+            'type': 'ack',
+            'ok': burner is not None,
+            'burner': format_burner_data(burner) if burner else None,
+        })
+
+@with_websocket
+async def _live_socket(request, ws):
+    client = LiveSocket(ws)
+    LiveSocket.clients += 1
+    pusher = asyncio.create_task(client.push_updates())
+    try:
+        while True:
+            await client.handle(await ws.receive())
+    finally:
+        pusher.cancel()
+        LiveSocket.clients -= 1
+
+@app.route('/api/ws')
+async def api_ws(request):
+    if LiveSocket.clients >= config.WS_MAX_CLIENTS:
+        return Response({'status': 'too many sockets'}, 503, headers={'Retry-After': '30'})
+    return await _live_socket(request)
 
 @app.route('/api/schedules', methods=['GET'])
 async def get_schedules(request):
-    return Response(json.dumps(scheduler.get_schedules()), headers={'Content-Type': 'application/json'})
+    return Response(JSONStream(scheduler.get_schedules()), headers={'Content-Type': 'application/json'})
 
 @app.route('/api/schedules', methods=['POST'])
 async def save_schedule(request):
@@ -351,22 +680,13 @@ async def api_settings(request):
     mode, priority = data.get('mode'), data.get('priority')
 
     if mode is not None and priority is not None:
-        success = await npbc_controller.set_mode_and_priority(int(mode), int(priority))
-
-        if not success:
-            return Response({'status': 'failed to set'}, 500)
-
-        await asyncio.sleep_ms(250)
-
         try:
-            new_burner_data_obj = await npbc_controller.get_general_information()
-            if new_burner_data_obj:
-                new_burner_data_dict = new_burner_data_obj.to_dict()
-                app_state['burner'] = new_burner_data_dict
+            new_burner_data_dict = await apply_settings(npbc_controller, int(mode), int(priority))
+            if new_burner_data_dict:
                 formatted_data = format_burner_data(new_burner_data_dict)
                 return Response(json.dumps(formatted_data), 200)
             else:
-                return Response({'status': 'failed to read back state'}, 500)
+                return Response({'status': 'failed to set'}, 500)
         except Exception as e:
             log(f"Error reading back state in /api/settings: {e}")
             return Response({'status': 'error readback'}, 500)
@@ -376,12 +696,13 @@ async def api_settings(request):
 @app.route('/api/update', methods=['POST'])
 async def api_update(request):
     log("OTA update requested.")
-    try:
-        success, message = ota_updater.download_and_install_update_if_available()
-        return Response({'status': 'success' if success else 'no_update', 'message': message}, 200)
-    except Exception as e:
-        log(f"OTA update failed with exception: {e}")
-        return Response({'status': 'error', 'message': str(e)}, 500)
+    if not ota_updater.start():
+        return Response({'status': 'busy', 'message': 'An update is already in progress.'}, 409)
+    return Response({'status': 'started', 'message': 'Checking for updates...'}, 202)
+
+@app.route('/api/update/status')
+async def api_update_status(request):
+    return Response(ota_updater.status, headers={'Cache-Control': 'no-cache'})
 
 @app.route('/api/reboot', methods=['POST'])
 async def api_reboot(request):
@@ -406,12 +727,30 @@ async def main():
     log("Starting data collector task...")
     asyncio.create_task(data_collector_task(npbc_controller, sensor_reader))
 
+    if config.REMOTE_POST_URL:
+        log("Starting outbox task...")
+        asyncio.create_task(outbox.run())
+
+    if mqtt_publisher:
+        log(f"Starting MQTT publisher for {config.MQTT_BROKER}...")
+        asyncio.create_task(mqtt_publisher.run())
+
     log("Starting scheduler task...")
     asyncio.create_task(scheduler_task(npbc_controller, sensor_reader))
 
     log("Starting NTP sync task...")
     asyncio.create_task(ntp_sync_task())
 
+    if config.OTA_CHECK_INTERVAL:
+        log("Starting OTA check task...")
+        asyncio.create_task(ota_updater.run_checks(config.OTA_CHECK_INTERVAL))
+
+    if ota_stage.on_trial or ota_stage.watchdog_armed:
+        log("Starting OTA health task...")
+        asyncio.create_task(ota_health_task())
+
+    gc.collect()
+    log(f"Started in {time.ticks_ms()} ms after reset, {gc.mem_free()} bytes free")
     ip_addr = network.WLAN(network.STA_IF).ifconfig()[0]
     log(f'Starting web server on http://{ip_addr}')
     await app.start_server(port=80, debug=True)
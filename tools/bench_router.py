@@ -0,0 +1,132 @@
+# tools/bench_router.py - Compare Microdot route lookup strategies
+#
+# Registers the dashboard's route set on a Microdot app and times
+# find_route() for typical request paths, against the original linear
+# scan that runs every route's regular expression. Both must agree on
+# the handler, the URL arguments and 404/405 results. Runs on CPython
+# and on the device:
+#
+#   python3 tools/bench_router.py
+#   mpremote run tools/bench_router.py
+import sys
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter
+
+    def ticks_us():
+        return int(perf_counter() * 1000000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+try:
+    import os.path
+    ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+except (ImportError, NameError):
+    ROOT = ''  # on the device, where the project lives at /
+sys.path.insert(0, ROOT + '/lib')
+from microdot import Microdot  # noqa: E402
+
+# (pattern, methods) as registered by main.py
+ROUTES = (
+    ('/', ['GET']),
+    ('/static/<path:path>', ['GET']),
+    ('/api/data', ['GET']),
+    ('/metrics', ['GET']),
+    ('/api/line', ['GET']),
+    ('/api/stream', ['GET']),
+    ('/api/ws', ['GET']),
+    ('/api/schedules', ['GET']),
+    ('/api/schedules', ['POST']),
+    ('/api/schedules/<schedule_id>', ['DELETE']),
+    ('/api/settings', ['POST']),
+    ('/api/update', ['POST']),
+    ('/api/update/status', ['GET']),
+    ('/api/reboot', ['POST']),
+    # regression: regular expression segments must not match as strings
+    ('/n/<re:[0-9]+:n>', ['GET']),
+    ('/n/<re:[a-z]+:word>/<int:i>', ['GET']),
+)
+
+REQUESTS = (
+    ('GET', '/'),
+    ('GET', '/api/data'),
+    ('GET', '/api/data?since=1'),
+    ('GET', '/static/style.css'),
+    ('GET', '/api/stream'),
+    ('POST', '/api/schedules'),
+    ('DELETE', '/api/schedules/1a2b3c'),
+    ('POST', '/api/settings'),
+    ('GET', '/api/update/status'),
+    ('GET', '/n/42'),
+    ('GET', '/n/abc'),              # 404
+    ('GET', '/n/abc/7'),
+    ('GET', '/n/42/7'),             # 404
+    ('GET', '/api/settings'),       # 405
+    ('GET', '/favicon.ico'),        # 404
+)
+
+ROUNDS = 200
+
+
+class FakeRequest:
+    def __init__(self, method, url):
+        self.method = method
+        self.path = url.split('?', 1)[0]
+        self.url_args = None
+
+
+def make_app():
+    app = Microdot()
+    for pattern, methods in ROUTES:
+        def handler(request, **kwargs):
+            pass
+        app.route(pattern, methods=methods)(handler)
+    return app
+
+
+def linear_find_route(app, req):
+    """The original Microdot lookup, for reference."""
+    method = 'GET' if req.method == 'HEAD' else req.method
+    f = 404
+    for route_methods, route_pattern, route_handler, _, _ in app.url_map:
+        req.url_args = route_pattern.match(req.path)
+        if req.url_args is not None:
+            if method in route_methods:
+                f = route_handler
+                break
+            f = 405
+    return f
+
+
+def bench(name, lookup):
+    requests = [FakeRequest(m, u) for m, u in REQUESTS]
+    start = ticks_us()
+    for _ in range(ROUNDS):
+        for req in requests:
+            lookup(req)
+    us = ticks_diff(ticks_us(), start) / (ROUNDS * len(requests))
+    print(f'{name:8s} {us:8.1f} us/lookup')
+
+
+def main():
+    app = make_app()
+    for method, url in REQUESTS:
+        a, b = FakeRequest(method, url), FakeRequest(method, url)
+        expected = linear_find_route(app, a)
+        got = app.find_route(b)[0]
+        if got != expected or (callable(got) and a.url_args != b.url_args):
+            print(f'MISMATCH {method} {url}: {got} {b.url_args} != '
+                  f'{expected} {a.url_args}')
+            return 1
+    print(f'{len(ROUTES)} routes, {len(REQUESTS)} request paths, '
+          f'{ROUNDS} rounds')
+    bench('linear', lambda req: linear_find_route(app, req))
+    bench('indexed', app.find_route)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
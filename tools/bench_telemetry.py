@@ -0,0 +1,71 @@
+# tools/bench_telemetry.py - Compare remote payload encodings
+#
+# Measures payload size and encode time for a batch of typical samples
+# using JSON (the original json=full_data path), the packed codec, and
+# the packed codec with deflate. Runs on CPython and on the device:
+#
+#   python3 tools/bench_telemetry.py
+#   mpremote run tools/bench_telemetry.py
+import sys
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter
+
+    def ticks_us():
+        return int(perf_counter() * 1000000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+try:
+    import os.path
+    ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+except (ImportError, NameError):
+    ROOT = '/'  # on the device, where the project lives at /
+sys.path.insert(0, ROOT)
+from lib.telemetry_codec import encode, decode  # noqa: E402
+
+SAMPLE = {
+    'SwVer': '1.6', 'Date': '2026-01-15 21:04:30', 'Mode': 1, 'State': 0,
+    'Status': 9, 'IgnitionFail': False, 'PelletJam': False, 'Tset': 65,
+    'Tboiler': 63, 'DHW': 48, 'Flame': 112, 'Heater': False, 'DHWPump': False,
+    'CHPump': True, 'BF': False, 'FF': True, 'Fan': 55, 'Power': 3,
+    'ThermostatStop': False, 'FFWorkTime': 0, 'BME_TYPE': 'BME280',
+    'TBMP': 21.37, 'PBMP': 1013.42, 'HUM': 47.12, 'TDS18': 41.5, 'KTYPE': 142.25,
+}
+ROUNDS = 20
+
+
+def bench(name, fn, batch):
+    payload = fn(batch)
+    start = ticks_us()
+    for _ in range(ROUNDS):
+        fn(batch)
+    us = ticks_diff(ticks_us(), start) // ROUNDS
+    print(f'{name:<16} {len(batch):>5} {len(payload):>8} {us:>10}')
+    return payload
+
+
+def main():
+    print(f'{"format":<16} {"batch":>5} {"bytes":>8} {"encode us":>10}')
+    for n in (1, 10, 30):
+        batch = []
+        for i in range(n):
+            sample = dict(SAMPLE)
+            sample['Tboiler'] += i % 3
+            sample['KTYPE'] += i * 0.25
+            batch.append(sample)
+        bench('json', lambda b: json.dumps(b[0] if len(b) == 1 else b).encode(), batch)
+        bench('packed', lambda b: encode(b), batch)
+        frame = bench('packed+deflate', lambda b: encode(b, compress=True), batch)
+        assert decode(frame) == batch
+
+
+main()
@@ -0,0 +1,152 @@
+# tools/build_assets.py - Build minified, pre-gzipped dashboard assets
+#
+# Minifies templates/index.html and everything under static/, gzips the
+# results and writes them to www/ together with www/assets.json, which
+# main.py uses to serve the compressed variants:
+#
+#   python3 tools/build_assets.py             # build www/
+#   python3 tools/build_assets.py --manifest  # ... and list www/ in main.json
+#
+# Static files get a content hash in their name (style.1a2b3c4d.css), so
+# the device can let browsers cache them for a year; index.html keeps its
+# name and is revalidated with an ETag instead. Output is reproducible:
+# unchanged sources give byte-identical files.
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUT_DIR = 'www'
+INDEX = 'templates/index.html'
+STATIC_DIR = 'static'
+
+
+def minify_css(text):
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,])\s*', r'\1', text)
+    return text.replace(';}', '}').strip()
+
+
+def minify_html(text):
+    """
+    Conservative line-based minifier: strips indentation, blank lines,
+    HTML comments and whole-line // comments inside <script>. Line breaks
+    are kept so that inline JavaScript never depends on semicolon
+    insertion rules.
+    """
+    text = re.sub(r'<!--.*?-->', '', text, flags=re.S)
+    out = []
+    in_script = False
+    for line in text.splitlines():
+        line = line.strip()
+        if '<script' in line:
+            in_script = True
+        if '</script' in line:
+            in_script = False
+        if not line or (in_script and line.startswith('//')):
+            continue
+        out.append(line)
+    return '\n'.join(out) + '\n'
+
+
+def minify(path, text):
+    if path.endswith('.css'):
+        return minify_css(text)
+    if path.endswith('.html'):
+        return minify_html(text)
+    return text
+
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()[:8]
+
+
+def write_gz(rel_path, data):
+    path = os.path.join(ROOT, rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    gz = gzip.compress(data, 9, mtime=0)
+    with open(path, 'wb') as f:
+        f.write(gz)
+    return len(gz)
+
+
+def build():
+    out = os.path.join(ROOT, OUT_DIR)
+    if os.path.isdir(out):
+        shutil.rmtree(out)
+    assets = {}
+    renames = {}
+
+    for name in sorted(os.listdir(os.path.join(ROOT, STATIC_DIR))):
+        source = f'{STATIC_DIR}/{name}'
+        with open(os.path.join(ROOT, source), 'rb') as f:
+            raw = f.read()
+        try:
+            data = minify(name, raw.decode()).encode()
+        except UnicodeDecodeError:
+            data = raw
+        h = digest(data)
+        stem, dot, ext = name.rpartition('.')
+        hashed = f'{stem}.{h}.{ext}' if dot else f'{name}.{h}'
+        target = f'{OUT_DIR}/static/{hashed}.gz'
+        size = write_gz(target, data)
+        renames[f'/static/{name}'] = f'/static/{hashed}'
+        assets[f'/static/{hashed}'] = {
+            'file': target, 'source': source, 'etag': f'"{h}"',
+            'size': size, 'immutable': True,
+        }
+        print(f'{source}: {len(raw)} -> {len(data)} -> {size} bytes gzipped')
+
+    with open(os.path.join(ROOT, INDEX), encoding='utf-8') as f:
+        raw = f.read()
+    html = minify_html(raw)
+    for old, new in renames.items():
+        html = html.replace(f'"{old}"', f'"{new}"')
+    data = html.encode()
+    target = f'{OUT_DIR}/index.html.gz'
+    size = write_gz(target, data)
+    assets['/'] = {
+        'file': target, 'source': INDEX, 'etag': f'"{digest(data)}"',
+        'size': size,
+    }
+    print(f'{INDEX}: {len(raw.encode())} -> {len(data)} -> {size} bytes gzipped')
+
+    with open(os.path.join(out, 'assets.json'), 'w') as f:
+        json.dump(assets, f, indent=2, sort_keys=True)
+        f.write('\n')
+    return sorted([a['file'] for a in assets.values()] + [f'{OUT_DIR}/assets.json'])
+
+
+def update_manifest(files):
+    """Replaces the www/ entries of the OTA file list in main.json."""
+    path = os.path.join(ROOT, 'main.json')
+    with open(path) as f:
+        manifest = json.load(f)
+    manifest['files'] = [p for p in manifest['files']
+                         if not p.startswith(OUT_DIR + '/')] + files
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.write('\n')
+    print(f'main.json: {len(files)} asset files listed')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build minified, pre-gzipped dashboard assets into www/.')
+    parser.add_argument('--manifest', action='store_true',
+                        help='update the OTA file list in main.json')
+    args = parser.parse_args()
+    files = build()
+    if args.manifest:
+        update_manifest(files)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
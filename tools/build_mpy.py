@@ -0,0 +1,85 @@
+# tools/build_mpy.py - Precompile the firmware's modules to .mpy bytecode
+#
+# Runs mpy-cross over every module listed in main.json and writes the
+# results to mpy/ (lib/ota.py -> mpy/lib/ota.mpy). Their bytecode
+# version, sizes and SHA-256 hashes go into the "mpy" section of
+# main.json. Devices whose firmware runs that bytecode version install
+# the .mpy files in place of the sources, which skips compiling them on
+# every boot; all others keep installing the .py files:
+#
+#   pip install mpy-cross     # must match the firmware's MicroPython
+#   python3 tools/build_mpy.py
+#
+# main.py and boot.py are always installed as source: MicroPython only
+# runs them as .py files.
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lib.ota_bundle import MPY_DIR  # noqa: E402
+from make_manifest import sha256  # noqa: E402
+
+SOURCE_ONLY = ('main.py', 'boot.py')
+
+
+def mpy_version(mpy_cross):
+    """Returns the bytecode version mpy-cross emits, e.g. '6.3'."""
+    out = subprocess.run([mpy_cross, '--version'], capture_output=True,
+                         text=True, check=True).stdout
+    match = re.search(r'mpy v(\d+)\.(\d+)', out)
+    if not match:
+        raise SystemExit(f'Cannot tell the bytecode version from: {out.strip()}')
+    return f'{match.group(1)}.{match.group(2)}'
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Precompile the firmware modules to .mpy files in mpy/.')
+    parser.add_argument('--mpy-cross', default='mpy-cross',
+                        help='mpy-cross executable (default: from PATH)')
+    args = parser.parse_args()
+    if not shutil.which(args.mpy_cross):
+        print(f'{args.mpy_cross} not found; install it with: pip install mpy-cross')
+        return 1
+    version = mpy_version(args.mpy_cross)
+
+    path = os.path.join(ROOT, 'main.json')
+    with open(path) as f:
+        manifest = json.load(f)
+    out_dir = os.path.join(ROOT, MPY_DIR)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    compiled, hashes, sizes = [], {}, {}
+    py_total = 0
+    for src in manifest['files']:
+        if not src.endswith('.py') or src in SOURCE_ONLY:
+            continue
+        target = src[:-3] + '.mpy'
+        out = os.path.join(out_dir, target)
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        # -s keeps tracebacks pointing at the source file name
+        subprocess.run([args.mpy_cross, '-s', src, '-o', out, src],
+                       cwd=ROOT, check=True)
+        compiled.append(src)
+        hashes[target] = sha256(out)
+        sizes[target] = os.path.getsize(out)
+        py_total += os.path.getsize(os.path.join(ROOT, src))
+
+    manifest['mpy'] = {'version': version, 'files': compiled,
+                       'sha256': hashes, 'size': sizes}
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.write('\n')
+    print(f'{MPY_DIR}/: {len(compiled)} modules for mpy v{version}, '
+          f'{py_total} -> {sum(sizes.values())} bytes')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# tools/decode_telemetry.py - Server-side decoder for packed telemetry posts
+#
+# Decodes frames posted with REMOTE_POST_FORMAT = 'packed' back into the
+# same dicts the JSON format carries, and prints them as JSON lines.
+#
+#   python3 tools/decode_telemetry.py frame.bin [...]
+#   curl ... | python3 tools/decode_telemetry.py -
+#
+# Receiving servers can also import `decode` from lib/telemetry_codec.py,
+# which has no MicroPython-only dependencies.
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from lib.telemetry_codec import decode  # noqa: E402
+
+
+def main(paths):
+    for path in paths or ['-']:
+        if path == '-':
+            frame = sys.stdin.buffer.read()
+        else:
+            with open(path, 'rb') as f:
+                frame = f.read()
+        for record in decode(frame):
+            print(json.dumps(record))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,77 @@
+# tools/make_bundle.py - Build the single-file OTA bundle for a release
+#
+# Packs every file listed in main.json into one compressed ota.bundle
+# (format in lib/ota_bundle.py). Attach it to the GitHub release as an
+# asset named ota.bundle; the updater then fetches the whole release in
+# one download instead of one request per file:
+#
+#   python3 tools/make_bundle.py              # writes dist/ota.bundle
+#   python3 tools/make_bundle.py -o dist/
+#
+# If tools/build_mpy.py has run, a second bundle with the .mpy files,
+# e.g. dist/ota-mpy6.3.bundle, is written for devices running that
+# bytecode version; attach it as well.
+#
+# Run tools/make_manifest.py first: the bundle header is main.json, and
+# its hashes must match the files being packed.
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lib.ota_bundle import bundle_name, mpy_manifest, pack  # noqa: E402
+from make_manifest import sha256  # noqa: E402
+
+
+def read_file(path):
+    with open(os.path.join(ROOT, path), 'rb') as f:
+        return f.read()
+
+
+def stale_files(manifest):
+    """Returns the files whose hash in `manifest` does not match."""
+    hashes = manifest.get('sha256') or {}
+    remote = manifest.get('remote') or {}
+    return [p for p in manifest['files']
+            if hashes.get(p) != sha256(os.path.join(ROOT, remote.get(p, p)))]
+
+
+def write_bundle(manifest, path):
+    bundle = pack(manifest, read_file)
+    with open(path, 'wb') as f:
+        f.write(bundle)
+    total = sum(manifest['size'].values())
+    print(f"{path}: version {manifest['version']}, "
+          f"{len(manifest['files'])} files, {total} -> {len(bundle)} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the single-file OTA bundles.')
+    parser.add_argument('-o', '--output', default=os.path.join(ROOT, 'dist'),
+                        help='output directory (default: dist/)')
+    args = parser.parse_args()
+
+    with open(os.path.join(ROOT, 'main.json')) as f:
+        manifest = json.load(f)
+    variants = [(manifest, bundle_name())]
+    mpy = mpy_manifest(manifest)
+    if mpy:
+        variants.append((mpy, bundle_name(manifest['mpy']['version'])))
+    for variant, _ in variants:
+        stale = stale_files(variant)
+        if stale or 'size' not in variant:
+            print('main.json is out of date, run tools/make_manifest.py '
+                  '(and tools/build_mpy.py) first: ' + ', '.join(stale))
+            return 1
+
+    os.makedirs(args.output, exist_ok=True)
+    for variant, name in variants:
+        write_bundle(variant, os.path.join(args.output, name))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,51 @@
+# tools/make_manifest.py - Add file hashes and sizes to the OTA manifest
+#
+# Computes the SHA-256 and size of every file listed in main.json and
+# stores them in its "sha256" and "size" maps. The updater checks each
+# download against its hash and skips files whose local copy already
+# matches:
+#
+#   python3 tools/make_manifest.py
+#
+# Run it after every change to a listed file, right before tagging a
+# release. "files" stays a plain list of paths, so devices running older
+# firmware can still read the manifest.
+import hashlib
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def main():
+    path = os.path.join(ROOT, 'main.json')
+    with open(path) as f:
+        manifest = json.load(f)
+    missing = [p for p in manifest['files']
+               if not os.path.isfile(os.path.join(ROOT, p))]
+    if missing:
+        print('Missing files: ' + ', '.join(missing))
+        return 1
+    manifest['sha256'] = {p: sha256(os.path.join(ROOT, p))
+                          for p in manifest['files']}
+    manifest['size'] = {p: os.path.getsize(os.path.join(ROOT, p))
+                        for p in manifest['files']}
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.write('\n')
+    print(f"main.json: {len(manifest['files'])} files hashed, "
+          f"{sum(manifest['size'].values())} bytes")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
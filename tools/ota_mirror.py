@@ -0,0 +1,329 @@
+# tools/ota_mirror.py - LAN mirror for OTA releases
+#
+# Serves the firmware's releases to the devices on the local network, so
+# a fleet downloads each release from GitHub once. Point the devices at
+# it with OTA_SOURCE = 'mirror' and OTA_MIRROR_URL = 'http://<host>:8080'.
+#
+#   python3 tools/ota_mirror.py                  # mirror GitHub, cache in dist/mirror/
+#   python3 tools/ota_mirror.py --publish 1.5    # add this checkout as release 1.5
+#   python3 tools/ota_mirror.py --offline        # serve the cache only
+#
+# It answers with GitHub's layout under one base URL:
+#   /repos/<owner>/<repo>/releases/latest             release JSON (with ETag)
+#   /<owner>/<repo>/<tag>/<path>                      release files
+#   /<owner>/<repo>/releases/download/<tag>/<asset>   bundles
+# Files are fetched from GitHub on first use and then served from the
+# cache, with Range requests. The cache directory mirrors these URLs, so a
+# local release directory can be laid out by hand or with --publish and
+# served with --offline, without any internet access. If GitHub cannot be
+# reached, the last known release keeps being served.
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lib.ota_bundle import mpy_manifest  # noqa: E402
+
+GITHUB_API = 'https://api.github.com'
+GITHUB_RAW = 'https://raw.githubusercontent.com'
+GITHUB = 'https://github.com'
+USER_AGENT = 'npbc-ota-mirror'
+CHUNK_SIZE = 65536
+
+
+def default_repo():
+    with open(os.path.join(ROOT, 'config_defaults.py')) as f:
+        match = re.search(r"^GITHUB_REPO\s*=\s*'([^']+)'", f.read(), re.M)
+    return match.group(1).rstrip('/').replace('https://github.com/', '')
+
+
+class Mirror:
+    """The release cache: fetches from GitHub unless offline."""
+
+    def __init__(self, repo, cache_dir, offline=False, refresh=300):
+        self.repo = repo
+        self.cache_dir = cache_dir
+        self.offline = offline
+        self.refresh = refresh
+        self._checked = 0
+        self._locks = {}  # cache path -> lock held while downloading it
+        self._locks_lock = threading.Lock()
+
+    def path(self, url_path):
+        """Cache file for a URL path, or None if it leaves the cache."""
+        parts = [p for p in url_path.split('/') if p]
+        if any(p in ('.', '..') for p in parts):
+            return None
+        return os.path.join(self.cache_dir, *parts)
+
+    def _latest_file(self):
+        return self.path(f'repos/{self.repo}/releases/latest.json')
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def _fetch(self, url, headers=None):
+        request = urllib.request.Request(url, headers={'User-Agent': USER_AGENT, **(headers or {})})
+        return urllib.request.urlopen(request, timeout=30)
+
+    def latest(self):
+        """Returns the cached latest release {'tag_name', 'assets', 'etag'},
+        refreshing it from GitHub at most every `refresh` seconds."""
+        path = self._latest_file()
+        cached = None
+        if os.path.exists(path):
+            with open(path) as f:
+                cached = json.load(f)
+        if self.offline or time.time() - self._checked < self.refresh:
+            return cached
+        self._checked = time.time()
+        headers = {'If-None-Match': cached['github_etag']} \
+            if cached and cached.get('github_etag') else {}
+        try:
+            with self._fetch(f'{GITHUB_API}/repos/{self.repo}/releases/latest', headers) as resp:
+                release = json.load(resp)
+                github_etag = resp.headers.get('ETag')
+        except urllib.error.HTTPError as e:
+            if e.code != 304:
+                print(f'GitHub: HTTP {e.code}, serving the cached release')
+            return cached
+        except OSError as e:
+            print(f'GitHub unreachable ({e}), serving the cached release')
+            return cached
+        self.set_latest(release['tag_name'],
+                        {a['name']: a['browser_download_url'] for a in release.get('assets', [])},
+                        github_etag)
+        with open(path) as f:
+            return json.load(f)
+
+    def set_latest(self, tag, assets, github_etag=None):
+        """Records `tag` as the latest release; `assets` maps asset names to
+        their upstream URLs (None for local files)."""
+        body = json.dumps({'tag_name': tag, 'assets': assets}, sort_keys=True)
+        latest = {
+            'tag_name': tag,
+            'assets': assets,
+            'etag': '"' + hashlib.sha256(body.encode()).hexdigest()[:16] + '"',
+            'github_etag': github_etag,
+        }
+        self._write(self._latest_file(), json.dumps(latest, indent=2).encode())
+
+    def file(self, url_path, upstream):
+        """Returns the cache path for url_path, downloading it from
+        `upstream` first if needed; None if it is not available."""
+        path = self.path(url_path)
+        if path is None or os.path.isfile(path):
+            return path
+        if self.offline or not upstream:
+            return None
+        with self._locks_lock:
+            lock = self._locks.setdefault(path, threading.Lock())
+        # one thread downloads, the others wait for its result
+        with lock:
+            if os.path.isfile(path):
+                return path
+            try:
+                with self._fetch(upstream) as resp:
+                    data = resp.read()
+            except (urllib.error.HTTPError, OSError) as e:
+                print(f'Cannot fetch {upstream}: {e}')
+                return None
+            self._write(path, data)
+        print(f'Cached {url_path} ({len(data)} bytes)')
+        return path
+
+    def publish(self, tag, src_dir):
+        """Copies the release in a checkout (main.json and its files, mpy/
+        and the bundles in dist/) into the cache and makes it the latest."""
+        with open(os.path.join(src_dir, 'main.json')) as f:
+            manifest = json.load(f)
+        if manifest.get('version') != tag:
+            print(f"Warning: main.json says version {manifest.get('version')}")
+        base = f'{self.repo}/{tag}'
+        paths = ['main.json'] + manifest['files']
+        mpy = mpy_manifest(manifest)
+        if mpy:
+            paths += [mpy['remote'][p] for p in mpy['files'] if p in mpy['remote']]
+        for rel in paths:
+            dst = self.path(f'{base}/{rel}')
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copyfile(os.path.join(src_dir, rel), dst)
+        assets = {}
+        dist = os.path.join(src_dir, 'dist')
+        for name in sorted(os.listdir(dist)) if os.path.isdir(dist) else ():
+            if name.endswith('.bundle'):
+                dst = self.path(f'{self.repo}/releases/download/{tag}/{name}')
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                shutil.copyfile(os.path.join(dist, name), dst)
+                assets[name] = None
+        self.set_latest(tag, assets)
+        print(f"Published {tag}: {len(paths)} files, bundles: {', '.join(assets) or 'none'}")
+
+
+def parse_range(header, size):
+    """Returns (start, end) for a single 'bytes=' range, or None if it
+    cannot be satisfied. Multiple ranges are not supported."""
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', header.strip())
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    if match.group(1):
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else size - 1
+    else:
+        start = max(size - int(match.group(2)), 0)
+        end = size - 1
+    end = min(end, size - 1)
+    if start > end:
+        return None
+    return start, end
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'ota-mirror'
+    mirror = None
+    base_url = None  # where the devices reach this mirror
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head=False):
+        mirror = self.mirror
+        path = self.path.split('?', 1)[0]
+        repo = '/' + mirror.repo + '/'
+        if path == f'/repos/{mirror.repo}/releases/latest':
+            return self.send_latest(head)
+        if path.startswith(repo + 'releases/download/'):
+            tag, _, name = path[len(repo + 'releases/download/'):].partition('/')
+            upstream = (mirror.latest() or {}).get('assets', {}).get(name) \
+                or f'{GITHUB}/{mirror.repo}/releases/download/{tag}/{name}'
+            return self.send_cached(path, upstream, head)
+        if path.startswith(repo):
+            return self.send_cached(path, GITHUB_RAW + path, head)
+        self.send_error(404)
+
+    def send_latest(self, head):
+        latest = self.mirror.latest()
+        if latest is None:
+            return self.send_error(503, 'No release known yet')
+        if self.headers.get('If-None-Match') == latest['etag']:
+            self.send_response(304)
+            self.send_header('ETag', latest['etag'])
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        # asset URLs point back at this mirror
+        tag = latest['tag_name']
+        body = json.dumps({
+            'tag_name': tag,
+            'assets': [{'name': name,
+                        'browser_download_url':
+                            f'{self.base_url}/{self.mirror.repo}/releases/download/{tag}/{name}'}
+                       for name in sorted(latest['assets'])],
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', latest['etag'])
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def send_cached(self, url_path, upstream, head):
+        path = self.mirror.file(url_path, upstream)
+        if path is None or not os.path.isfile(path):
+            return self.send_error(404)
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        status = 200
+        if self.headers.get('Range'):
+            byte_range = parse_range(self.headers['Range'], size)
+            if byte_range is None:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            start, end = byte_range
+            status = 206
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        if head:
+            return
+        with open(path, 'rb') as f:
+            f.seek(start)
+            left = end - start + 1
+            while left > 0:
+                chunk = f.read(min(CHUNK_SIZE, left))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                left -= len(chunk)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LAN mirror for OTA releases.')
+    parser.add_argument('--repo', default=default_repo(),
+                        help='GitHub repository, owner/name (default: GITHUB_REPO)')
+    parser.add_argument('--cache', default=os.path.join(ROOT, 'dist', 'mirror'),
+                        help='cache directory (default: dist/mirror/)')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--base-url',
+                        help='URL the devices reach the mirror at, used in the release '
+                             'JSON (default: http://<this hostname or --host>:<port>)')
+    parser.add_argument('--offline', action='store_true',
+                        help='never contact GitHub; serve the cache only')
+    parser.add_argument('--refresh', type=int, default=300,
+                        help='seconds between checks for a new GitHub release')
+    parser.add_argument('--publish', metavar='TAG',
+                        help='copy this checkout into the cache as release TAG and exit')
+    args = parser.parse_args()
+
+    mirror = Mirror(args.repo, args.cache, args.offline, args.refresh)
+    if args.publish:
+        mirror.publish(args.publish, ROOT)
+        return 0
+    Handler.mirror = mirror
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    host, port = server.server_address[:2]
+    if host in ('0.0.0.0', '::'):
+        host = socket.gethostname()
+    Handler.base_url = (args.base_url or f'http://{host}:{port}').rstrip('/')
+    print(f"Mirroring {args.repo} on {Handler.base_url} "
+          f"({'offline, ' if args.offline else ''}cache {args.cache})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+# tools/test_metrics.py - Checks for the /metrics and /api/line renderers
+#
+# Runs lib/metrics.py on CPython with the samples SensorReader.read_all()
+# produces, including one where every sensor has failed, and checks the
+# output is sent in socket-sized chunks:
+#
+#   python3 tools/test_metrics.py
+#
+# Exits non-zero on the first failure.
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lib import metrics  # noqa: E402
+
+BURNER = {'Mode': 1, 'State': 5, 'Tboiler': 62, 'Flame': 48, 'Fan': 70}
+SENSORS = {'BME_TYPE': 'BME280', 'TBMP': 21.37, 'PBMP': 1013.25,
+           'HUM': 45.1, 'TDS18': 58.5, 'KTYPE': 143.25}
+# what read_all() returns with the BME280 and DS18X20 gone
+FAILED_SENSORS = {'BME_TYPE': 'N/A', 'TBMP': 0.0, 'PBMP': 0.0,
+                  'TDS18': 0.0, 'KTYPE': 0.0}
+# an integer that slipped through must still be written as a float
+INT_SENSORS = {'BME_TYPE': 'N/A', 'TBMP': 0, 'PBMP': 0, 'TDS18': 0, 'KTYPE': 0}
+
+
+def influx_fields(sensors):
+    """Renders one /api/line document; returns {field: value text} of the
+    sensor line."""
+    text = ''.join(metrics.influx('npbc', [('burner', BURNER), ('sensor', sensors)],
+                                  {}, tags={'version': '1.0'}, float_groups=('sensor',)))
+    for line in text.splitlines():
+        head, _, fields = line.partition(' ')
+        if head.endswith(',group=sensor'):
+            return dict(field.split('=', 1) for field in fields.split(','))
+    raise AssertionError(f'no sensor line in {text!r}')
+
+
+def field_type(value):
+    if value.startswith('"'):
+        return 'string'
+    if value in ('true', 'false'):
+        return 'boolean'
+    if value.endswith('i'):
+        return 'integer'
+    float(value)
+    return 'float'
+
+
+def test_failed_sensor_keeps_field_types():
+    """A failed sensor must not turn a float field into an integer one,
+    or InfluxDB rejects the line with a field type conflict."""
+    good = {k: field_type(v) for k, v in influx_fields(SENSORS).items()}
+    for sample in (FAILED_SENSORS, INT_SENSORS):
+        failed = influx_fields(sample)
+        for key, value in failed.items():
+            if field_type(value) != good[key]:
+                raise AssertionError(f'{key}={value} is {field_type(value)}, '
+                                     f'normally {good[key]}')
+
+
+def test_burner_fields_stay_integers():
+    text = ''.join(metrics.influx('npbc', [('burner', BURNER)], {}))
+    if 'Tboiler=62i' not in text:
+        raise AssertionError(f'burner integers changed: {text!r}')
+
+
+def test_output_is_chunked():
+    """Lines go out in chunks of about CHUNK_SIZE, not one write each."""
+    stats = {f'component{i}': {'sent': i, 'errors': 0, 'queue': 3} for i in range(20)}
+    groups = [('burner', BURNER), ('sensor', SENSORS)]
+    for name, chunks in (('prometheus', list(metrics.prometheus('npbc', groups, stats))),
+                         ('influx', list(metrics.influx('npbc', groups, stats)))):
+        text = ''.join(chunks)
+        if len(chunks) > len(text) // metrics.CHUNK_SIZE + 1:
+            raise AssertionError(f'{name}: {len(chunks)} chunks for {len(text)} bytes')
+        for chunk in chunks[:-1]:
+            if len(chunk) < metrics.CHUNK_SIZE or not chunk.endswith('\n'):
+                raise AssertionError(f'{name}: short or split chunk {chunk[-40:]!r}')
+
+
+def main():
+    tests = (test_failed_sensor_keeps_field_types, test_burner_fields_stay_integers,
+             test_output_is_chunked)
+    for test in tests:
+        try:
+            test()
+        except AssertionError as e:
+            print(f'FAIL {test.__name__}: {e}')
+            return 1
+        print(f'ok   {test.__name__}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
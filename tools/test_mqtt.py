@@ -0,0 +1,315 @@
+# tools/test_mqtt.py - In-process broker test for the MQTT client and publisher
+#
+# Runs lib/mqtt.py and lib/mqtt_publisher.py on CPython against a small
+# MQTT 3.1.1 broker in this process, connected through the client's
+# open_connection hook. Covers CONNECT, the QoS 1 in-flight window,
+# redelivery after a reconnect and the <prefix>/set command topic:
+#
+#   python3 tools/test_mqtt.py
+#
+# Exits non-zero on the first failure.
+import asyncio
+import json
+import os
+import struct
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The device modules the client imports, backed by the host
+sys.modules.setdefault('uasyncio', asyncio)
+sys.modules.setdefault('ujson', json)
+if 'micropython' not in sys.modules:
+    micropython = types.ModuleType('micropython')
+    micropython.const = lambda x: x
+    sys.modules['micropython'] = micropython
+
+from lib import mqtt, mqtt_publisher  # noqa: E402
+from lib.mqtt import MQTTClient  # noqa: E402
+from lib.mqtt_publisher import MQTTPublisher  # noqa: E402
+
+LOG = []
+mqtt.log = mqtt_publisher.log = LOG.append
+
+
+def _encode_str(s):
+    return struct.pack('!H', len(s)) + s
+
+
+def _packet(header, body):
+    return bytes([header]) + mqtt._encode_length(len(body)) + body
+
+
+class Broker:
+    """
+    Just enough of an MQTT 3.1.1 broker for one client: persistent
+    sessions, SUBSCRIBE, and QoS 0/1 PUBLISH in both directions. With
+    `acks` off, the client's QoS 1 publishes are held unacknowledged
+    until release().
+    """
+
+    def __init__(self):
+        self.connects = []      # (client id, clean session, session present)
+        self.subscribes = []    # topics, in order received
+        self.received = []      # dicts describing each PUBLISH from the client
+        self.pubacks = []       # packet ids the client acknowledged
+        self.acks = True
+        self._held = []
+        self._sessions = set()
+        self._writer = None
+        self._server = None
+        self._open = 0
+        self.port = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, '127.0.0.1', 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        await self.drop()
+        self._server.close()
+        await self._server.wait_closed()
+        await until(lambda: not self._open, 'the broker connections to close')
+
+    async def open_connection(self, host, port):
+        """The client's open_connection hook; ignores the broker address."""
+        return await asyncio.open_connection('127.0.0.1', self.port)
+
+    async def _read_packet(self, reader):
+        header = (await reader.readexactly(1))[0]
+        length = 0
+        shift = 0
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                break
+            shift += 7
+        return header, await reader.readexactly(length) if length else b''
+
+    async def _send(self, data):
+        self._writer.write(data)
+        await self._writer.drain()
+
+    async def _serve(self, reader, writer):
+        self._writer = writer
+        self._open += 1
+        try:
+            while True:
+                header, body = await self._read_packet(reader)
+                await self._handle(header, body)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+            self._open -= 1
+
+    async def _handle(self, header, body):
+        kind = header & 0xF0
+        if kind == 0x10:  # CONNECT
+            pos = 2 + struct.unpack('!H', body[:2])[0] + 1
+            flags = body[pos]
+            pos += 3
+            client_id = body[pos + 2:pos + 2 + struct.unpack('!H', body[pos:pos + 2])[0]].decode()
+            clean = bool(flags & 0x02)
+            present = not clean and client_id in self._sessions
+            self._sessions.add(client_id)
+            self.connects.append((client_id, clean, present))
+            await self._send(bytes([0x20, 2, int(present), 0]))
+        elif kind == 0x30:  # PUBLISH
+            qos = (header >> 1) & 0x03
+            tlen = struct.unpack('!H', body[:2])[0]
+            pos = 2 + tlen
+            pid = struct.unpack('!H', body[pos:pos + 2])[0] if qos else None
+            if qos:
+                pos += 2
+            self.received.append({
+                'topic': body[2:2 + tlen].decode(), 'payload': body[pos:],
+                'qos': qos, 'pid': pid, 'dup': bool(header & 0x08),
+                'retain': bool(header & 0x01)})
+            if qos:
+                if self.acks:
+                    await self._send(bytes([0x40, 2]) + struct.pack('!H', pid))
+                else:
+                    self._held.append(pid)
+        elif kind == 0x40:  # PUBACK
+            self.pubacks.append(struct.unpack('!H', body)[0])
+        elif kind == 0x80:  # SUBSCRIBE
+            pid = body[:2]
+            tlen = struct.unpack('!H', body[2:4])[0]
+            self.subscribes.append(body[4:4 + tlen].decode())
+            await self._send(bytes([0x90, 3]) + pid + bytes([body[4 + tlen]]))
+        elif kind == 0xC0:  # PINGREQ
+            await self._send(bytes([0xD0, 0]))
+
+    async def release(self):
+        """Acknowledges the held publishes and stops holding new ones."""
+        self.acks = True
+        held, self._held = self._held, []
+        for pid in held:
+            await self._send(bytes([0x40, 2]) + struct.pack('!H', pid))
+
+    async def publish(self, topic, payload, pid):
+        """Sends a QoS 1 message to the client."""
+        body = _encode_str(topic.encode()) + struct.pack('!H', pid) + payload
+        await self._send(_packet(0x32, body))
+
+    async def drop(self):
+        """Cuts the connection, as a broker restart or a Wi-Fi drop would."""
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+
+    def topics(self):
+        return [p['topic'] for p in self.received]
+
+
+async def until(predicate, what, timeout=5):
+    for _ in range(int(timeout * 100)):
+        if predicate():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f'timed out waiting for {what}')
+
+
+def check(condition, what):
+    if not condition:
+        raise AssertionError(what)
+
+
+async def running_client(broker, **kwargs):
+    client = MQTTClient('npbc-test', 'broker.invalid', keepalive=60,
+                        open_connection=broker.open_connection, **kwargs)
+    await client.subscribe('npbc/set')
+    task = asyncio.create_task(client.run())
+    await until(lambda: client.connected, 'CONNACK')
+    return client, task
+
+
+async def test_connect(broker):
+    client, task = await running_client(broker)
+    check(broker.connects == [('npbc-test', False, False)],
+          f'CONNECT: {broker.connects}')
+    await until(lambda: broker.subscribes == ['npbc/set'], 'SUBSCRIBE')
+    await client.publish('npbc/T', '1', qos=0)
+    await until(lambda: broker.received, 'QoS 0 PUBLISH')
+    check(broker.received[0]['qos'] == 0 and broker.received[0]['pid'] is None,
+          f'QoS 0 PUBLISH: {broker.received[0]}')
+    task.cancel()
+
+
+async def test_inflight_window(broker):
+    client, task = await running_client(broker, max_inflight=4)
+    broker.acks = False
+
+    async def burst():
+        for i in range(6):
+            await client.publish(f'npbc/f{i}', str(i), qos=1)
+
+    sender = asyncio.create_task(burst())
+    await until(lambda: len(broker.received) == 4, 'the first 4 publishes')
+    await asyncio.sleep(0.2)
+    check(len(broker.received) == 4, f'window overrun: {broker.topics()}')
+    check(client.stats()['inflight'] == 4, f"inflight: {client.stats()['inflight']}")
+    await broker.release()
+    await until(lambda: len(broker.received) == 6, 'the rest after PUBACK')
+    await sender
+    await until(lambda: client.stats()['inflight'] == 0, 'all acknowledged')
+    pids = [p['pid'] for p in broker.received]
+    check(len(set(pids)) == 6 and not any(p['dup'] for p in broker.received),
+          f'packet ids / DUP: {broker.received}')
+    task.cancel()
+
+
+async def test_redelivery(broker):
+    client, task = await running_client(broker)
+    broker.acks = False
+    await client.publish('npbc/a', '1', qos=1)
+    await client.publish('npbc/b', '2', qos=1)
+    await until(lambda: len(broker.received) == 2, 'two unacknowledged publishes')
+    first = [(p['topic'], p['pid']) for p in broker.received]
+    await broker.drop()
+    await until(lambda: not client.connected, 'the client to notice the drop')
+    # published while offline: queued and sent after the reconnect
+    await client.publish('npbc/c', '3', qos=1)
+    await until(lambda: len(broker.connects) == 2 and client.connected, 'the reconnect')
+    check(broker.connects[1] == ('npbc-test', False, True),
+          f'session not resumed: {broker.connects}')
+    check(broker.subscribes == ['npbc/set'], f'resubscribed to a resumed session: {broker.subscribes}')
+    await until(lambda: len(broker.received) == 5, 'the retransmissions')
+    again = broker.received[2:]
+    redelivered = [(p['topic'], p['pid']) for p in again if p['dup']]
+    check(sorted(redelivered) == sorted(first + [('npbc/c', again[-1]['pid'])]),
+          f'redelivered {redelivered}, expected {first} and npbc/c')
+    await broker.release()
+    await until(lambda: client.stats()['inflight'] == 0, 'the acknowledgements')
+    check(client.reconnects == 1, f'reconnects: {client.reconnects}')
+    task.cancel()
+
+
+async def test_commands(broker):
+    calls = []
+
+    async def command_handler(mode, priority):
+        calls.append((mode, priority))
+        return {'Mode': mode, 'Priority': priority}
+
+    client = MQTTClient('npbc-test', 'broker.invalid', keepalive=60,
+                        open_connection=broker.open_connection)
+    publisher = MQTTPublisher(client, command_handler=command_handler)
+    task = asyncio.create_task(publisher.run())
+    await until(lambda: broker.subscribes == ['npbc/set'], 'the command subscription')
+
+    # a command before the first sample must not publish a partial state
+    await broker.publish('npbc/set', b'{"mode": 1, "priority": 0}', 7)
+    await until(lambda: 7 in broker.pubacks, 'PUBACK for the command')
+    await until(lambda: calls == [(1, 0)], 'the command handler')
+    await asyncio.sleep(0.1)
+    check(not broker.received, f'published before the first sample: {broker.topics()}')
+
+    publisher.update({'Mode': 1, 'Priority': 0, 'Tboiler': 62, 'TBMP': 21.5})
+    await until(lambda: 'npbc/state' in broker.topics(), 'the keyframe')
+    state = [p for p in broker.received if p['topic'] == 'npbc/state'][0]
+    check(json.loads(state['payload'])['TBMP'] == 21.5 and state['retain'],
+          f'keyframe: {state}')
+
+    del broker.received[:]
+    await broker.publish('npbc/set', b'{"mode": 2, "priority": 1}', 8)
+    await until(lambda: 'npbc/Priority' in broker.topics(), 'the read-back')
+    check(sorted(broker.topics()) == ['npbc/Mode', 'npbc/Priority'],
+          f'read-back published {broker.topics()}')
+
+    await broker.publish('npbc/set', b'not json', 9)
+    await until(lambda: 9 in broker.pubacks, 'PUBACK for the malformed command')
+    check(calls == [(1, 0), (2, 1)], f'handler calls: {calls}')
+    task.cancel()
+
+
+async def run(test):
+    broker = Broker()
+    await broker.start()
+    try:
+        await asyncio.wait_for(test(broker), 15)
+    finally:
+        await broker.stop()
+
+
+def main():
+    tests = (test_connect, test_inflight_window, test_redelivery, test_commands)
+    for test in tests:
+        del LOG[:]
+        try:
+            asyncio.run(run(test))
+        except AssertionError as e:
+            print(f'FAIL {test.__name__}: {e}')
+            for line in LOG:
+                print(f'     log: {line}')
+            return 1
+        print(f'ok   {test.__name__}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+# tools/test_ota_mirror.py - End-to-end check of the LAN release mirror
+#
+# Publishes a small release from a temporary checkout into a temporary
+# cache (as --publish does), serves it offline on an ephemeral port and
+# checks what the devices rely on: the release JSON and its ETag, ranged
+# bundle downloads and per-file raw paths:
+#
+#   python3 tools/test_ota_mirror.py
+#
+# Exits non-zero on the first failure.
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'tools'))
+
+import ota_mirror  # noqa: E402
+from ota_mirror import Handler, Mirror  # noqa: E402
+
+REPO = 'owner/firmware'
+TAG = '2.0'
+FILES = {
+    'main.py': b'print("main")\n',
+    'lib/ota.py': b'# ota\n' * 50,
+}
+BUNDLE = bytes(range(256)) * 8
+
+
+def make_checkout(path):
+    """A checkout after the release steps: main.json, its files and a bundle."""
+    for rel, data in FILES.items():
+        os.makedirs(os.path.dirname(os.path.join(path, rel)), exist_ok=True)
+        with open(os.path.join(path, rel), 'wb') as f:
+            f.write(data)
+    with open(os.path.join(path, 'main.json'), 'w') as f:
+        json.dump({'version': TAG, 'files': sorted(FILES)}, f)
+    os.makedirs(os.path.join(path, 'dist'))
+    with open(os.path.join(path, 'dist', 'ota.bundle'), 'wb') as f:
+        f.write(BUNDLE)
+
+
+def get(base, path, headers=None):
+    """Returns (status, headers, body); HTTP errors are returned too."""
+    request = urllib.request.Request(base + path, headers=headers or {})
+    try:
+        with urllib.request.urlopen(request, timeout=5) as resp:
+            return resp.status, resp.headers, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def check(condition, what):
+    if not condition:
+        raise AssertionError(what)
+
+
+def test_release_json(base):
+    status, headers, body = get(base, f'/repos/{REPO}/releases/latest',
+                                {'Host': 'attacker.example'})
+    check(status == 200, f'latest: HTTP {status}')
+    release = json.loads(body)
+    check(release['tag_name'] == TAG, f'tag: {release}')
+    urls = [a['browser_download_url'] for a in release['assets']]
+    check(urls == [f'{base}/{REPO}/releases/download/{TAG}/ota.bundle'],
+          f'asset URLs ignore the Host header: {urls}')
+    etag = headers['ETag']
+    status, headers, body = get(base, f'/repos/{REPO}/releases/latest',
+                                {'If-None-Match': etag})
+    check(status == 304 and not body and headers['ETag'] == etag,
+          f'matching ETag: HTTP {status}')
+    status, _, _ = get(base, f'/repos/{REPO}/releases/latest', {'If-None-Match': '"stale"'})
+    check(status == 200, f'stale ETag: HTTP {status}')
+
+
+def test_ranged_bundle(base):
+    path = f'/{REPO}/releases/download/{TAG}/ota.bundle'
+    status, headers, body = get(base, path)
+    check(status == 200 and body == BUNDLE, f'full bundle: HTTP {status}, {len(body)} bytes')
+    check(headers['Accept-Ranges'] == 'bytes', 'no Accept-Ranges')
+    status, headers, body = get(base, path, {'Range': 'bytes=1000-'})
+    check(status == 206 and body == BUNDLE[1000:], f'resumed download: HTTP {status}')
+    check(headers['Content-Range'] == f'bytes 1000-{len(BUNDLE) - 1}/{len(BUNDLE)}',
+          f"Content-Range: {headers['Content-Range']}")
+    status, _, body = get(base, path, {'Range': 'bytes=-16'})
+    check(status == 206 and body == BUNDLE[-16:], f'suffix range: HTTP {status}')
+    status, headers, _ = get(base, path, {'Range': f'bytes={len(BUNDLE)}-'})
+    check(status == 416 and headers['Content-Range'] == f'bytes */{len(BUNDLE)}',
+          f'unsatisfiable range: HTTP {status}')
+
+
+def test_raw_files(base):
+    for rel, data in FILES.items():
+        status, _, body = get(base, f'/{REPO}/{TAG}/{rel}')
+        check(status == 200 and body == data, f'{rel}: HTTP {status}')
+    status, _, body = get(base, f'/{REPO}/{TAG}/main.json')
+    check(status == 200 and json.loads(body)['version'] == TAG, f'main.json: HTTP {status}')
+    # offline: nothing outside the cache, and no way out of it
+    for path in (f'/{REPO}/{TAG}/missing.py', f'/{REPO}/{TAG}/../../../etc/passwd',
+                 '/other/repo/1.0/main.py'):
+        status, _, _ = get(base, path)
+        check(status == 404, f'{path}: HTTP {status}')
+
+
+def main():
+    tmp = tempfile.mkdtemp(prefix='ota-mirror-')
+    server = None
+    try:
+        checkout = os.path.join(tmp, 'checkout')
+        make_checkout(checkout)
+        mirror = Mirror(REPO, os.path.join(tmp, 'cache'), offline=True)
+        ota_mirror.print = lambda *args, **kwargs: None
+        mirror.publish(TAG, checkout)
+
+        Handler.mirror = mirror
+        Handler.log_message = lambda self, *args: None
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        base = 'http://127.0.0.1:%d' % server.server_address[1]
+        Handler.base_url = base
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        for test in (test_release_json, test_ranged_bundle, test_raw_files):
+            try:
+                test(base)
+            except AssertionError as e:
+                print(f'FAIL {test.__name__}: {e}')
+                return 1
+            print(f'ok   {test.__name__}')
+        return 0
+    finally:
+        if server:
+            server.shutdown()
+            server.server_close()
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
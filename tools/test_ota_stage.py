@@ -0,0 +1,273 @@
+# tools/test_ota_stage.py - Power-loss harness for the staged OTA install
+#
+# Runs lib/ota_stage.py on CPython against a temporary directory and
+# cuts the power (aborts) at every single filesystem step of staging,
+# applying, rolling back and confirming an update. After each cut it
+# "reboots" (calls boot() again) and checks that the device ends up with
+# exactly the old or exactly the new set of files, never a mix:
+#
+#   python3 tools/test_ota_stage.py
+#
+# Exits non-zero on the first failure.
+import json
+import os
+import shutil
+import sys
+import tempfile
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The device modules ota_stage imports, backed by the host
+sys.modules.setdefault('uos', os)
+sys.modules.setdefault('ujson', json)
+if 'machine' not in sys.modules:
+    machine = types.ModuleType('machine')
+
+    class WDT:
+        def __init__(self, timeout):
+            self.timeout = timeout
+
+        def feed(self):
+            pass
+
+    machine.WDT = WDT
+    sys.modules['machine'] = machine
+
+from lib import ota_stage  # noqa: E402
+from lib.ota_stage import OTAStage  # noqa: E402
+
+OLD = {
+    'main.json': '{"version": "1.0"}',
+    'main.py': 'print("old main")',
+    'lib/a.py': 'A = 1',
+    'lib/gone.py': 'GONE = 1',
+}
+NEW = {
+    'main.json': '{"version": "2.0"}',
+    'main.py': 'print("new main")',
+    'lib/a.py': 'A = 2',
+    'lib/sub/new.py': 'NEW = 1',
+}
+NEW_FILES = ['main.py', 'lib/a.py', 'lib/sub/new.py', 'main.json']
+REMOVED = ['lib/gone.py']
+
+
+class PowerLoss(BaseException):
+    """Not an Exception, so no `except Exception` in the code under test
+    can swallow it."""
+
+
+class FlakyFS:
+    """Wraps uos and open() for ota_stage, failing the `fail_at`-th
+    filesystem change. A write cut short leaves an empty file behind."""
+
+    def __init__(self, fail_at=None):
+        self.fail_at = fail_at
+        self.ops = 0
+
+    def _step(self):
+        self.ops += 1
+        if self.ops == self.fail_at:
+            raise PowerLoss()
+
+    def __getattr__(self, name):
+        return getattr(os, name)
+
+    def rename(self, src, dst):
+        self._step()
+        os.rename(src, dst)
+
+    def remove(self, path):
+        self._step()
+        os.remove(path)
+
+    def mkdir(self, path):
+        self._step()
+        os.mkdir(path)
+
+    def rmdir(self, path):
+        self._step()
+        os.rmdir(path)
+
+    def open(self, path, mode='r'):
+        if 'w' in mode:
+            try:
+                self._step()
+            except PowerLoss:
+                open(path, mode).close()
+                raise
+        return open(path, mode)
+
+
+def install(fs):
+    ota_stage.uos = fs
+    ota_stage.open = fs.open
+    ota_stage.print = lambda *args, **kwargs: None
+
+
+def write_tree(root, files):
+    for path, text in files.items():
+        full = os.path.join(root, path)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        with open(full, 'w') as f:
+            f.write(text)
+
+
+def live_tree(root):
+    """The device's files, without the OTA bookkeeping."""
+    files = {}
+    for dirpath, dirnames, names in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d != '.ota']
+        for name in names:
+            full = os.path.join(dirpath, name)
+            with open(full) as f:
+                files[os.path.relpath(full, root).replace(os.sep, '/')] = f.read()
+    return files
+
+
+def stage_update(st):
+    """What OTAUpdater does: download into the stage, then commit."""
+    for path in NEW_FILES:
+        full = st.stage_path(path)
+        ota_stage._makedirs(full)
+        with ota_stage.open(full, 'w') as f:
+            f.write(NEW[path])
+    st.commit('2.0', NEW_FILES, REMOVED)
+
+
+def fresh():
+    root = tempfile.mkdtemp(prefix='ota-stage-')
+    write_tree(root, OLD)
+    return root, OTAStage(root, max_trial_boots=3, watchdog_ms=1000)
+
+
+def reboot(st):
+    install(FlakyFS())
+    return st.boot()
+
+
+def expect(root, files, what):
+    got = live_tree(root)
+    if got != files:
+        raise AssertionError(f'{what}: expected {sorted(files)}, got {sorted(got)} '
+                             f'(differs: {sorted(k for k in set(got) | set(files) if got.get(k) != files.get(k))})')
+
+
+def cut_everywhere(name, prepare, action, check):
+    """Runs `action` with the power cut at each step in turn, then reboots
+    and runs `check`. Returns the number of cut points tried."""
+    n = 0
+    while True:
+        n += 1
+        root, st = fresh()
+        try:
+            install(FlakyFS())
+            prepare(st)
+            fs = FlakyFS(fail_at=n)
+            install(fs)
+            try:
+                action(st)
+                finished = True
+            except PowerLoss:
+                finished = False
+            try:
+                check(root, st, finished)
+            except AssertionError as e:
+                raise AssertionError(f'{name}, power cut at step {n}: {e}')
+        finally:
+            shutil.rmtree(root)
+        if finished:
+            return n - 1
+
+
+def test_interrupted_download():
+    """A download cut short is never applied; the next update starts over."""
+    def action(st):
+        st.reset()
+        stage_update(st)
+
+    def check(root, st, finished):
+        reboot(st)
+        expect(root, NEW if finished else OLD,
+               'applied' if finished else 'download cut short')
+
+    return cut_everywhere('download', lambda st: None, action, check)
+
+
+def test_interrupted_apply():
+    """A cut while applying is finished by the next boot."""
+    def check(root, st, finished):
+        reboot(st)
+        expect(root, NEW, 'apply resumed on reboot')
+        if not st.on_trial:
+            raise AssertionError('update is not on trial')
+
+    return cut_everywhere('apply', stage_update, lambda st: st.boot(), check)
+
+
+def test_interrupted_rollback():
+    """A cut while rolling back is finished by the next boot."""
+    def prepare(st):
+        stage_update(st)
+        for _ in range(st.max_trial_boots):
+            st.boot()
+
+    def check(root, st, finished):
+        reboot(st)
+        expect(root, OLD, 'rollback resumed on reboot')
+        if st.on_trial:
+            raise AssertionError('still on trial after rollback')
+
+    return cut_everywhere('rollback', prepare, lambda st: st.boot(), check)
+
+
+def test_interrupted_confirm():
+    """A cut while confirming a healthy update keeps the new version."""
+    def prepare(st):
+        stage_update(st)
+        st.boot()
+
+    def check(root, st, finished):
+        reboot(st)
+        expect(root, NEW, 'confirmed update kept')
+
+    return cut_everywhere('confirm', prepare, lambda st: st.mark_healthy(), check)
+
+
+def test_trial():
+    """Unconfirmed updates roll back after max_trial_boots boots."""
+    root, st = fresh()
+    try:
+        install(FlakyFS())
+        stage_update(st)
+        for boot in range(1, st.max_trial_boots + 1):
+            result = st.boot()
+            expect(root, NEW, f'trial boot {boot} ({result})')
+            if not st.watchdog_armed:
+                raise AssertionError('watchdog not armed on a trial boot')
+        result = st.boot()
+        expect(root, OLD, f'boot after the trial ({result})')
+        if st.boot() != 'no update':
+            raise AssertionError('rollback did not clear the trial')
+    finally:
+        shutil.rmtree(root)
+    return None
+
+
+def main():
+    tests = (test_interrupted_download, test_interrupted_apply,
+             test_interrupted_rollback, test_interrupted_confirm, test_trial)
+    for test in tests:
+        try:
+            cuts = test()
+        except AssertionError as e:
+            print(f'FAIL {test.__name__}: {e}')
+            return 1
+        print(f'ok   {test.__name__}' + (f' ({cuts} cut points)' if cuts else ''))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,190 @@
+# tools/test_outbox.py - Overflow checks for the store-and-forward outbox
+#
+# Runs lib/outbox.py on CPython against a journal in a temporary
+# directory and checks that a full journal drops the oldest samples,
+# keeps the newest, and delivers what is left in order, also across a
+# reboot and while a batch is being sent:
+#
+#   python3 tools/test_outbox.py
+#
+# Exits non-zero on the first failure.
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The device modules the outbox imports, backed by the host
+sys.modules.setdefault('uos', os)
+sys.modules.setdefault('ujson', json)
+if 'uasyncio' not in sys.modules:
+    uasyncio = types.ModuleType('uasyncio')
+    uasyncio.__dict__.update(asyncio.__dict__)
+    uasyncio.sleep_ms = lambda ms: asyncio.sleep(ms / 1000)
+    sys.modules['uasyncio'] = uasyncio
+
+from lib import outbox  # noqa: E402
+from lib.outbox import Outbox  # noqa: E402
+
+outbox.log = lambda msg: None
+
+
+class Host:
+    """The remote server: down until up() is called, and each send can be
+    held until release()."""
+
+    def __init__(self):
+        self.received = []
+        self.online = False
+        self.hold = False
+        self._gate = asyncio.Event()
+        self.waiting = False
+
+    async def send(self, batch):
+        if self.hold:
+            self.waiting = True
+            await self._gate.wait()
+            self.waiting = False
+        if not self.online:
+            return False
+        self.received.extend(s['n'] for s in batch)
+        return True
+
+    def release(self):
+        self.hold = False
+        self._gate.set()
+
+
+def make(journal, host, **kwargs):
+    kwargs.setdefault('queue_size', 2)
+    kwargs.setdefault('journal_max', 5)
+    return Outbox(host.send, journal=journal, backoff_min=0.01, backoff_max=0.01, **kwargs)
+
+
+async def until(predicate, what, timeout=5):
+    for _ in range(int(timeout * 100)):
+        if predicate():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f'timed out waiting for {what}')
+
+
+def check(condition, what):
+    if not condition:
+        raise AssertionError(what)
+
+
+def journal_lines(journal):
+    """Unsent samples in the journal, read the way a reboot would."""
+    pos = 0
+    if os.path.exists(journal + '.pos'):
+        with open(journal + '.pos') as f:
+            pos = int(f.read())
+    if not os.path.exists(journal):
+        return []
+    with open(journal) as f:
+        f.seek(pos)
+        return [json.loads(line)['n'] for line in f]
+
+
+async def test_overflow_keeps_newest(journal):
+    """A full journal drops its oldest samples, not the new ones."""
+    host = Host()
+    box = make(journal, host)
+    box._failures = 1  # the host is known to be down
+    for n in range(1, 13):
+        box.put({'n': n})
+    check(journal_lines(journal) == [8, 9, 10, 11, 12],
+          f'journal after overflow: {journal_lines(journal)}')
+    stats = box.stats()
+    check(stats['journaled'] == 5 and stats['dropped'] == 7, f'stats: {stats}')
+
+    host.online = True
+    task = asyncio.create_task(box.run())
+    await until(lambda: not box.stats()['journaled'], 'the journal to drain')
+    task.cancel()
+    check(host.received == [8, 9, 10, 11, 12], f'delivered {host.received}')
+    check(not os.path.exists(journal), 'journal left behind')
+
+
+async def test_overflow_survives_reboot(journal):
+    """The trimmed journal is what a reboot finds, and it stays bounded."""
+    host = Host()
+    box = make(journal, host)
+    box._failures = 1
+    for n in range(1, 101):
+        box.put({'n': n})
+    size = os.path.getsize(journal)
+    check(size < 4 * 5 * len('{"n": 100}\n'), f'journal grew to {size} bytes')
+
+    rebooted = make(journal, host)
+    check(rebooted.stats()['journaled'] == 5, f'after reboot: {rebooted.stats()}')
+    host.online = True
+    task = asyncio.create_task(rebooted.run())
+    await until(lambda: not rebooted.stats()['journaled'], 'the journal to drain')
+    task.cancel()
+    check(host.received == [96, 97, 98, 99, 100], f'delivered {host.received}')
+
+
+async def test_overflow_while_sending(journal):
+    """Samples in the batch being sent are not dropped under it; the next
+    oldest ones are."""
+    host = Host()
+    box = make(journal, host, batch_size=2)
+    box._failures = 1
+    for n in range(1, 6):
+        box.put({'n': n})
+    host.online = True
+    host.hold = True
+    task = asyncio.create_task(box.run())
+    await until(lambda: host.waiting, 'the first batch to be in flight')
+    for n in range(6, 9):
+        box.put({'n': n})
+    check(box.stats()['journaled'] == 5, f'while sending: {box.stats()}')
+    host.release()
+    await until(lambda: not box.stats()['journaled'] and not box.stats()['queued'],
+                'everything to drain')
+    task.cancel()
+    check(host.received == [1, 2, 6, 7, 8], f'delivered {host.received}')
+    check(box.stats()['dropped'] == 3, f'stats: {box.stats()}')
+
+
+async def test_interrupted_compaction(journal):
+    """A power loss between removing the old journal and renaming the
+    compacted one keeps the compacted samples."""
+    with open(journal + '.tmp', 'w') as f:
+        for n in (4, 5):
+            f.write(json.dumps({'n': n}) + '\n')
+    host = Host()
+    box = make(journal, host)
+    check(box.stats()['journaled'] == 2, f'recovered: {box.stats()}')
+    host.online = True
+    task = asyncio.create_task(box.run())
+    await until(lambda: not box.stats()['journaled'], 'the journal to drain')
+    task.cancel()
+    check(host.received == [4, 5], f'delivered {host.received}')
+
+
+def main():
+    tests = (test_overflow_keeps_newest, test_overflow_survives_reboot,
+             test_overflow_while_sending, test_interrupted_compaction)
+    for test in tests:
+        root = tempfile.mkdtemp(prefix='outbox-')
+        try:
+            asyncio.run(asyncio.wait_for(test(os.path.join(root, 'outbox.jsonl')), 10))
+        except AssertionError as e:
+            print(f'FAIL {test.__name__}: {e}')
+            return 1
+        finally:
+            shutil.rmtree(root)
+        print(f'ok   {test.__name__}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())